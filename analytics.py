@@ -0,0 +1,285 @@
+"""
+Vectorized daily analytics shared by the summary text and the charts.
+
+Aggregates folds a preprocessed frame into per-day counts plus running
+(cumulative) sums in one NumPy pass. Overall, rolling 7/30-day and
+period-over-period rates are then differences of cumulative sums, so new days
+can be appended (replacing overlapping days) without re-aggregating the
+history. Rows whose date could not be parsed count towards the totals but not
+towards any daily series.
+"""
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from data_processor import GROUP_COLUMN, NUMERIC_COLUMNS
+
+# 指标 -> (完成列, 未完成列)
+METRICS = {
+    'push': ('日报推送', '日报未推送'),
+    'wear': ('手表佩戴', '手表未佩戴'),
+}
+ROLLING_WINDOWS = (7, 30)
+# |z| 超过该值的日期标记为异常
+ANOMALY_Z = 2.5
+
+_COLUMN_INDEX = {col: i for i, col in enumerate(NUMERIC_COLUMNS)}
+
+
+def _daily(days, counts):
+    """
+    Sums rows sharing a day. Returns (sorted unique days, per-day counts).
+    """
+    if len(days) and np.all(days[1:] > days[:-1]):
+        return days, counts
+    order = np.argsort(days, kind='stable')
+    days, counts = days[order], counts[order]
+    unique, starts = np.unique(days, return_index=True)
+    if len(unique) == len(days):
+        return unique, counts
+    return unique, np.add.reduceat(counts, starts, axis=0)
+
+
+def _day_number(date):
+    return int(np.datetime64(pd.Timestamp(date).date(), 'D').astype('int64'))
+
+
+def _rate(done, total):
+    # 分母为 0 的位置返回 NaN
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, done / np.where(total > 0, total, 1) * 100, np.nan)
+
+
+class Aggregates:
+    """
+    Per-day metric counts with cumulative sums. Instances are never modified;
+    append() and between() return new instances.
+    """
+
+    def __init__(self, days, counts, undated, cumsum=None):
+        # days: 升序且唯一的日序号 (datetime64[D] 的整数值)
+        # counts: (天数, 4) 每日计数，列顺序同 NUMERIC_COLUMNS
+        # undated: 日期无法解析的行的计数合计
+        self.days = days
+        self.counts = counts
+        self.undated = undated
+        if cumsum is None:
+            cumsum = np.concatenate([np.zeros((1, counts.shape[1]), dtype='int64'),
+                                     np.cumsum(counts, axis=0)])
+        self.cumsum = cumsum
+        self._daily_frame = None
+
+    @classmethod
+    def empty(cls):
+        width = len(NUMERIC_COLUMNS)
+        return cls(np.empty(0, dtype='int64'), np.empty((0, width), dtype='int64'),
+                   np.zeros(width, dtype='int64'))
+
+    @classmethod
+    def from_frame(cls, df):
+        counts = df[NUMERIC_COLUMNS].to_numpy(dtype='int64')
+        dates = np.asarray(df.index.values, dtype='datetime64[D]')
+        dated = ~np.isnat(dates)
+        days, daily = _daily(dates[dated].astype('int64'), counts[dated])
+        return cls(days, daily, counts[~dated].sum(axis=0))
+
+    def append(self, df):
+        """
+        Returns the aggregates with the rows of `df` folded in. A day present
+        in `df` replaces that day's counts instead of adding to them (like
+        HistoryStore.upsert); undated rows add to the undated totals. Daily
+        counts and cumulative sums before the first day of `df` are reused.
+        """
+        new = Aggregates.from_frame(df)
+        undated = self.undated + new.undated
+        if not len(new.days):
+            return Aggregates(self.days, self.counts, undated, self.cumsum)
+        # 第一个新日期之前的部分不变，只重排并重新累加其后的日期
+        first = int(np.searchsorted(self.days, new.days[0], side='left'))
+        kept = ~np.isin(self.days[first:], new.days)
+        tail_days = np.concatenate([self.days[first:][kept], new.days])
+        tail_counts = np.concatenate([self.counts[first:][kept], new.counts])
+        order = np.argsort(tail_days, kind='stable')
+        tail_counts = tail_counts[order]
+        return Aggregates(np.concatenate([self.days[:first], tail_days[order]]),
+                          np.concatenate([self.counts[:first], tail_counts]), undated,
+                          np.concatenate([self.cumsum[:first + 1],
+                                          self.cumsum[first] + np.cumsum(tail_counts, axis=0)]))
+
+    def between(self, start=None, end=None):
+        """
+        Returns the aggregates of the days in [start, end] (dates, inclusive;
+        open when None) without re-summing them. Undated rows belong to no
+        range and are left out.
+        """
+        low = 0 if start is None else int(np.searchsorted(self.days, _day_number(start), 'left'))
+        high = (len(self.days) if end is None
+                else int(np.searchsorted(self.days, _day_number(end), 'right')))
+        return Aggregates(self.days[low:high], self.counts[low:high],
+                          np.zeros_like(self.undated), self.cumsum[low:high + 1] - self.cumsum[low])
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def dates(self):
+        return pd.DatetimeIndex(self.days.astype('datetime64[D]'), name='date')
+
+    @property
+    def totals(self):
+        """
+        Column -> total count over all rows, dated or not.
+        """
+        return {col: int(n) for col, n in zip(NUMERIC_COLUMNS, self.cumsum[-1] + self.undated)}
+
+    def _columns(self, metric):
+        done, missed = METRICS[metric]
+        return _COLUMN_INDEX[done], _COLUMN_INDEX[missed]
+
+    def _window_rate(self, metric, start, end):
+        # start/end 为 cumsum 的行号数组，区间为 [start, end)
+        i, j = self._columns(metric)
+        sums = self.cumsum[end] - self.cumsum[start]
+        return _rate(sums[..., i], sums[..., i] + sums[..., j])
+
+    def rate(self, metric):
+        """
+        Overall rate in percent, 0 when there is no data.
+        """
+        totals = self.cumsum[-1] + self.undated
+        i, j = self._columns(metric)
+        total = totals[i] + totals[j]
+        return float(totals[i] / total * 100) if total > 0 else 0.0
+
+    def daily_rate(self, metric):
+        i, j = self._columns(metric)
+        return _rate(self.counts[:, i], self.counts[:, i] + self.counts[:, j])
+
+    def rolling_rate(self, metric, window=7):
+        """
+        Rate over the `window` calendar days ending at each day (gaps count
+        as days without data).
+        """
+        end = np.arange(1, len(self.days) + 1)
+        start = np.searchsorted(self.days, self.days - window + 1, side='left')
+        return self._window_rate(metric, start, end)
+
+    def period_rate(self, metric, days=7, offset=0):
+        """
+        Rate over the `days` calendar days ending `offset` days before the
+        last day, or None without data in that period.
+        """
+        if not len(self.days):
+            return None
+        last = self.days[-1] - offset
+        start = np.searchsorted(self.days, last - days + 1, side='left')
+        end = np.searchsorted(self.days, last, side='right')
+        value = self._window_rate(metric, start, end)
+        return None if np.isnan(value) else float(value)
+
+    def week_over_week(self, metric):
+        """
+        Per-day change of the rolling 7-day rate against the 7 days before,
+        in percentage points.
+        """
+        end = np.arange(1, len(self.days) + 1)
+        start = np.searchsorted(self.days, self.days - 6, side='left')
+        prev_end = np.searchsorted(self.days, self.days - 7, side='right')
+        prev_start = np.searchsorted(self.days, self.days - 13, side='left')
+        return self._window_rate(metric, start, end) - self._window_rate(metric, prev_start, prev_end)
+
+    def extremes(self, metric):
+        """
+        Returns ((min_date, min_rate), (max_date, max_rate)) over days with
+        data, or None.
+        """
+        rates = self.daily_rate(metric)
+        if np.isnan(rates).all():
+            return None
+        low, high = np.nanargmin(rates), np.nanargmax(rates)
+        dates = self.dates
+        return (dates[low], float(rates[low])), (dates[high], float(rates[high]))
+
+    def zscores(self, metric):
+        rates = self.daily_rate(metric)
+        valid = ~np.isnan(rates)
+        if valid.sum() < 3:
+            return np.full(len(rates), np.nan)
+        std = rates[valid].std()
+        if std == 0:
+            return np.where(valid, 0.0, np.nan)
+        return (rates - rates[valid].mean()) / std
+
+    def anomalies(self, metric, threshold=ANOMALY_Z):
+        """
+        Dates whose daily rate is more than `threshold` standard deviations
+        from the mean.
+        """
+        with np.errstate(invalid='ignore'):
+            flags = np.abs(self.zscores(metric)) > threshold
+        return self.dates[flags]
+
+    def daily_frame(self):
+        """
+        Per-day totals shaped like a preprocessed frame ('日期' label, metric
+        columns, DatetimeIndex); used to chart grouped data as one series.
+        """
+        if self._daily_frame is None:
+            dates = self.dates
+            frame = pd.DataFrame(self.counts, index=dates, columns=NUMERIC_COLUMNS)
+            frame.insert(0, '日期', dates.strftime('%m-%d'))
+            self._daily_frame = frame
+        return self._daily_frame
+
+    def to_frame(self):
+        """
+        Daily table of every derived series, indexed by date.
+        """
+        data = {}
+        for metric in METRICS:
+            data[f'{metric}_rate'] = self.daily_rate(metric)
+            for window in ROLLING_WINDOWS:
+                data[f'{metric}_rate_{window}d'] = self.rolling_rate(metric, window)
+            data[f'{metric}_wow'] = self.week_over_week(metric)
+            data[f'{metric}_z'] = self.zscores(metric)
+        return pd.DataFrame(data, index=self.dates)
+
+
+# 按 DataFrame 对象缓存聚合结果；预处理后的帧只读，同一对象结果不变
+_memo = {}
+
+
+def aggregate(df):
+    """
+    Returns the shared Aggregates of a preprocessed frame, computing it once
+    per frame object.
+    """
+    entry = _memo.get(id(df))
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    return remember(df, Aggregates.from_frame(df))
+
+
+def remember(df, result):
+    """
+    Registers already computed Aggregates of `df` (e.g. a slice of
+    incrementally maintained history), so aggregate(df) returns them.
+    """
+    key = id(df)
+    _memo[key] = (weakref.ref(df, lambda _, key=key: _memo.pop(key, None)), result)
+    return result
+
+
+def has_groups(df):
+    return GROUP_COLUMN in df.columns
+
+
+def group_daily(df):
+    """
+    Sums the metric columns per (group, day) in one groupby pass. Returns a
+    frame indexed by (GROUP_COLUMN, date); rows without a parsed date are
+    dropped.
+    """
+    return (df.groupby([df[GROUP_COLUMN], df.index], observed=True, sort=True)[NUMERIC_COLUMNS]
+              .sum())
@@ -0,0 +1,343 @@
+"""
+HTTP API for report generation, independent of the Streamlit UI.
+
+    POST /report?title=...&title=...&push=%23FF0000&format=webp&quality=80
+        body: the workbook bytes (.xlsx / .xls / .csv / .parquet)
+        -> the composite image, with the stats JSON in the X-Report-Stats
+           header; add response=json for {"stats": ..., "image": base64}
+    GET /health
+        -> worker / queue state and per-stage timing totals
+
+Requests run on a scheduler.RenderScheduler with a fixed pool of pre-warmed
+worker threads. At most --workers + --queue distinct renders are admitted at
+once (503 beyond that); identical requests arriving while one is in flight
+share its render. A request that takes longer than --timeout answers 504
+while its render keeps going and is cached. Responses are cached by (upload
+hash, options), so repeated requests are answered without touching the
+pipeline.
+
+Usage:
+    python api_server.py --port 8502 --workers 4 --queue 16 --timeout 60
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from instrumentation import stage
+from instrumentation import stats as stage_stats
+from scheduler import RenderScheduler, SchedulerBusy
+
+DEFAULT_PORT = 8502
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_QUEUE = 16
+DEFAULT_TIMEOUT = 60
+# 单次上传的大小上限
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+# 完整响应（图片 + 统计）的缓存条目数
+RESPONSE_CACHE_SIZE = 64
+
+COLOR_KEYS = ('push', 'not_push', 'wear', 'not_wear')
+DPI_RANGE = (50, 300)
+
+
+class RequestError(Exception):
+    """
+    An error answered with an HTTP status instead of a 500.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_options(query):
+    """
+    Turns the query string into normalized report options. Raises
+    RequestError(400) for invalid values.
+    """
+    from chart_generator import DEFAULT_COLORS, DEFAULT_TITLES
+    from matplotlib.colors import is_color_like
+    from utils import DEFAULT_QUALITY, OUTPUT_FORMATS, RASTER_DPI
+
+    params = parse_qs(query)
+
+    def single(name, default=None):
+        values = params.get(name)
+        return values[-1] if values else default
+
+    def integer(name, default, low, high):
+        value = single(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise RequestError(400, f"{name} must be an integer")
+        if not low <= value <= high:
+            raise RequestError(400, f"{name} must be between {low} and {high}")
+        return value
+
+    # 未提供的标题沿用默认标题
+    titles = params.get('title', [])[:len(DEFAULT_TITLES)]
+    titles = titles + DEFAULT_TITLES[len(titles):]
+
+    colors = dict(DEFAULT_COLORS)
+    for key in COLOR_KEYS:
+        value = single(key)
+        if value is not None:
+            if not is_color_like(value):
+                raise RequestError(400, f"invalid color for {key}: {value}")
+            colors[key] = value
+
+    fmt = single('format', 'png')
+    if fmt not in OUTPUT_FORMATS:
+        raise RequestError(400, f"format must be one of {', '.join(OUTPUT_FORMATS)}")
+    response = single('response', 'image')
+    if response not in ('image', 'json'):
+        raise RequestError(400, "response must be 'image' or 'json'")
+
+    return {
+        'titles': titles,
+        'colors': colors,
+        'sheet': single('sheet'),
+        'fmt': fmt,
+        'quality': integer('quality', DEFAULT_QUALITY, 1, 100),
+        'max_width': integer('max_width', 0, 0, 20000) or None,
+        'dpi': integer('dpi', RASTER_DPI, *DPI_RANGE),
+        'response': response,
+    }
+
+
+def options_key(digest, options):
+    # response 只影响响应的封装方式，不参与缓存键
+    return (digest, tuple(options['titles']), tuple(sorted(options['colors'].items())),
+            options['sheet'], options['fmt'], options['quality'], options['max_width'],
+            options['dpi'])
+
+
+def build_report(data, options):
+    """
+    Runs the pipeline for one upload. Returns (EncodedImage, stats).
+    """
+    from data_processor import GROUP_COLUMN, calculate_stats
+    from pipeline import load_frame, render_panels
+    from utils import encode_image
+
+    digest, df = load_frame(data, sheet=options['sheet'])
+    combined = render_panels(digest, df, options['titles'], options['colors'], dpi=options['dpi'])
+    with stage('encode', format=options['fmt']) as event:
+        encoded = encode_image(combined, options['fmt'], options['quality'], options['max_width'])
+        event.bytes = len(encoded)
+
+    stats = calculate_stats(df)
+    stats.update({'rows': len(df), 'coercions': df.attrs.get('coercions', {})})
+    if GROUP_COLUMN in df.columns:
+        stats['groups'] = int(df[GROUP_COLUMN].nunique())
+    return encoded, stats
+
+
+class ReportService:
+    """
+    Render scheduler with per-request timeouts and a response cache keyed
+    by content hash and options.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE, timeout=DEFAULT_TIMEOUT):
+        from utils import LRUCache
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._scheduler = RenderScheduler(workers, queue_size)
+        self._cache = LRUCache(RESPONSE_CACHE_SIZE)
+        self._lock = threading.Lock()
+        self.timed_out = 0
+
+    def warm_up(self, parallel=False):
+        """
+        Imports the pipeline, configures fonts and renders a tiny report on
+        every worker thread, so the first real request pays none of it.
+        """
+        import pipeline
+        from create_dummy_data import make_frame
+        from fonts import setup_fonts
+
+        setup_fonts()
+        if parallel:
+            import render_pool
+            render_pool.warm_up()
+
+        buf = io.BytesIO()
+        make_frame(rows=7).to_csv(buf, index=False)
+        options = parse_options('')
+        start = time.perf_counter()
+        # 键各不相同，避免合并，保证每个工作线程都跑一遍
+        jobs = [self._scheduler.submit(('warm_up', i), build_report, buf.getvalue(), options)
+                for i in range(self.workers)]
+        for job in jobs:
+            job.result()
+        # 预热结果不保留在缓存里
+        pipeline.clear_caches()
+        print(f"Warmed up {self.workers} worker(s) in {time.perf_counter() - start:.2f}s")
+
+    def submit(self, data, options):
+        """
+        Returns (EncodedImage, stats, cached) or raises RequestError for a
+        full queue (503) or a timeout (504).
+        """
+        key = options_key(hashlib.sha256(data).hexdigest(), options)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached + (True,)
+
+        def run():
+            result = build_report(data, options)
+            # 即使请求已超时，完成的结果也写入缓存供重试使用
+            self._cache.put(key, result)
+            return result
+
+        try:
+            job = self._scheduler.submit(key, run)
+        except SchedulerBusy:
+            raise RequestError(503, "server busy, retry later")
+        try:
+            return job.result(timeout=self.timeout) + (False,)
+        except TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise RequestError(504, f"report not ready after {self.timeout}s")
+
+    def health(self):
+        state = self._scheduler.stats()
+        with self._lock:
+            state['timed_out'] = self.timed_out
+        state['cached_responses'] = len(self._cache)
+        state['stages'] = stage_stats.snapshot()
+        return state
+
+    def shutdown(self):
+        self._scheduler.shutdown()
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+    server_version = 'ChartReport/1.0'
+    # 读取请求体的套接字超时（秒），防止慢速客户端占住连接
+    timeout = 30
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self._send(status, body, 'application/json; charset=utf-8', headers)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/health':
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/report':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            options = parse_options(url.query)
+            length = int(self.headers.get('Content-Length') or 0)
+            if length <= 0:
+                raise RequestError(400, "request body must contain the workbook")
+            if length > MAX_UPLOAD_BYTES:
+                raise RequestError(413, f"upload larger than {MAX_UPLOAD_BYTES} bytes")
+            data = self.rfile.read(length)
+
+            with stage('api_request', bytes=length) as event:
+                encoded, stats, cached = self.service.submit(data, options)
+                event.info['cached'] = cached
+        except RequestError as e:
+            headers = {'Retry-After': '5'} if e.status == 503 else None
+            self._send_json(e.status, {'error': str(e)}, headers)
+            return
+        except ValueError as e:
+            # 文件无法解析或表头不符
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': f"internal error: {e}"})
+            return
+
+        if options['response'] == 'json':
+            self._send_json(200, {'stats': stats, 'format': options['fmt'], 'mime': encoded.mime,
+                                  'size': encoded.size, 'cached': cached,
+                                  'image': base64.b64encode(encoded.data).decode('ascii')})
+            return
+        # 统计信息放在响应头中，JSON 转义为 ASCII
+        self._send(200, encoded.data, encoded.mime, {
+            'X-Report-Stats': json.dumps(stats, default=str),
+            'X-Cache': 'hit' if cached else 'miss',
+        })
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+
+def make_server(host='127.0.0.1', port=DEFAULT_PORT, service=None):
+    server = ThreadingHTTPServer((host, port), ReportHandler)
+    server.daemon_threads = True
+    server.service = service or ReportService()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve chart reports over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help="render worker threads (default: CPU count)")
+    parser.add_argument('--queue', type=int, default=DEFAULT_QUEUE,
+                        help="requests allowed to wait beyond the busy workers")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds before a request answers 504")
+    parser.add_argument('--parallel', action='store_true',
+                        help="render report composites on a pool of worker processes")
+    args = parser.parse_args(argv)
+
+    if args.parallel:
+        os.environ['CHART_PARALLEL_RENDER'] = '1'
+    service = ReportService(args.workers, args.queue, args.timeout)
+    service.warm_up(parallel=args.parallel)
+
+    server = make_server(args.host, args.port, service)
+    print(f"Serving reports on http://{args.host}:{args.port} "
+          f"({args.workers} workers, queue {args.queue}, timeout {args.timeout:g}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
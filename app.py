@@ -1,37 +1,172 @@
 import streamlit as st
-import pandas as pd
-import time
-import io
-from data_processor import load_data, validate_columns, preprocess_data, calculate_stats
-from chart_generator import generate_line_chart_1, generate_line_chart_2, generate_bar_chart, generate_pie_chart
-from utils import combine_charts
+
+# 调度器与图表注册表只依赖标准库，可在顶层导入
+from chart_specs import CHART_SPECS, DEFAULT_TITLE_ALL
+from scheduler import Cancelled, SchedulerBusy
+
+# pandas / matplotlib / PIL 较重，在首次需要时才导入，页面可以先行显示
 
 # Set page config
 st.set_page_config(page_title="AI 自动图表生成系统", layout="wide", initial_sidebar_state="expanded")
 
+@st.cache_resource
+def preload_pipeline():
+    # 每个服务进程只执行一次：导入绘图模块、配置字体，并按需预热渲染进程池
+    import pipeline
+    from fonts import setup_fonts
+    setup_fonts()
+    if pipeline.PARALLEL_RENDER:
+        import render_pool
+        render_pool.warm_up()
+    return True
+
+METRIC_LABELS = {'push': '推送率', 'wear': '佩戴率'}
+# 汇总表中派生列的显示名（见 data_processor.build_rollups）
+ROLLUP_LABELS = {column.format(metric): label.format(name)
+                 for metric, name in METRIC_LABELS.items()
+                 for column, label in [('{}_rate', '{} (%)'), ('{}_rate_7d', '近 7 天{} (%)'),
+                                       ('{}_rate_30d', '近 30 天{} (%)'),
+                                       ('{}_wow', '{}周环比（百分点）'), ('{}_z', '{} z 值')]}
+# 输出格式选项 -> utils.OUTPUT_FORMATS 中的名称
+OUTPUT_FORMATS = {
+    'PNG（调色板，体积小）': 'png8',
+    'PNG（无损）': 'png',
+    'WebP': 'webp',
+    'JPEG': 'jpeg',
+}
+# 数据来源：本次上传的文件，或本地历史库中的日期范围
+DATA_SOURCES = {'上传文件': 'upload', '历史数据': 'history'}
+# 历史数据默认展示最近的天数
+HISTORY_DEFAULT_DAYS = 30
+# 显示模式：浏览器渲染的交互式图表，或服务器端渲染的图片
+DISPLAY_MODES = {'交互式（浏览器渲染）': 'web', '图片（服务器渲染）': 'image'}
+# 与 utils.DEFAULT_QUALITY 保持一致；此处不导入 utils 以保持启动轻量
+DEFAULT_QUALITY = 85
+# 分组小图的样式选项
+GROUP_STYLES = {'折线图': 'line', '柱状图': 'bar'}
+# 图表的时间粒度，与 data_processor.GRANULARITIES 保持一致
+GRANULARITIES = {'按日': 'day', '按周': 'week', '按月': 'month'}
+
+def summary_text(stats):
+    """
+    Builds the one-line summary from calculate_stats output.
+    """
+    parts = []
+    for metric, label in METRIC_LABELS.items():
+        rate = stats[f'{metric}_rate_7d']
+        if rate is None:
+            parts.append(f"整体{label} **{stats[f'{metric}_rate']:.1f}%**")
+            continue
+        text = f"最近一周{label} **{rate:.1f}%**"
+        wow = stats[f'{metric}_wow']
+        if wow is not None:
+            text += f"（较前一周 {wow:+.1f} 个百分点）"
+        parts.append(text)
+    return "📊 数据分析：" + "，".join(parts) + "。"
+
+# 阶段名 -> (完成后的进度, 开始时的提示)
+STAGE_PROGRESS = {
+    'load_frame': (30, "🔍 正在解析数据..."),
+    'load_history': (30, "🗄️ 正在读取历史数据..."),
+    'render_chart': (15, "🎨 正在生成图表..."),
+    'combine_charts': (100, "🖼️ 正在整合图表..."),
+    'render_panels': (100, "🖼️ 正在生成整合截图..."),
+}
+
+def progress_hook(progress_bar, status_text, timings):
+    """
+    Returns a stage hook that drives the progress bar and records timings.
+    """
+    state = {'percent': 0}
+    
+    def on_stage(event):
+        if event.phase == 'start':
+            if event.name in STAGE_PROGRESS:
+                filled = state['percent'] // 10
+                status_text.text(f"[{'#' * filled}{'-' * (10 - filled)}] {state['percent']}% "
+                                 f"{STAGE_PROGRESS[event.name][1]}")
+            return
+        
+        timings.append({
+            '阶段': event.name,
+            '图表': event.info.get('kind', ''),
+            '耗时 (ms)': round(event.duration * 1000, 1),
+            '行数': event.rows,
+            '字节': event.bytes,
+            '缓存命中': event.info.get('cached', event.info.get('hit')),
+        })
+        if event.name in STAGE_PROGRESS:
+            step = STAGE_PROGRESS[event.name][0]
+            # render_chart 每完成一张累加，其余阶段直接跳到目标进度
+            percent = state['percent'] + step if event.name == 'render_chart' else step
+            state['percent'] = min(100, max(state['percent'], percent))
+            progress_bar.progress(state['percent'])
+    
+    return on_stage
+
+def run_scheduled(key, on_stage, fn, *args):
+    """
+    Runs fn(*args) on the shared render scheduler and waits for it here.
+    Identical in-flight work (same key) is shared across sessions, and this
+    session's previous unfinished job is cancelled. Stage events from the
+    worker thread are queued and replayed on the script thread, which is the
+    only thread allowed to update Streamlit elements.
+    """
+    import queue
+    from concurrent.futures import TimeoutError
+    from instrumentation import hooks
+    from scheduler import get_scheduler
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    events = queue.SimpleQueue()
+    with hooks(events.put):
+        job = get_scheduler().submit(key, fn, *args, session=ctx.session_id if ctx else None)
+    while True:
+        try:
+            return job.result(timeout=0.1)
+        except TimeoutError:
+            pass
+        finally:
+            while not events.empty():
+                on_stage(events.get_nowait())
+
+def build_report(digest, df, titles, colors, fmt, quality, max_width, dpi, charts=True):
+    """
+    Renders the composite (and with `charts` the individual charts), then
+    encodes them for display/download.
+    """
+    from pipeline import encode_report, render_panels, render_report
+    if charts:
+        images, combined = render_report(digest, df, titles, colors, dpi=dpi)
+    else:
+        images, combined = [], render_panels(digest, df, titles, colors, dpi=dpi)
+    return encode_report(digest, titles, colors, images, combined, fmt, quality, max_width, dpi)
+
 def main():
     # Sidebar Configuration
     st.sidebar.header("📊 图表设置")
     
-    # 标题设置
-    st.sidebar.subheader("📝 标题设置")
-    default_title_all = "12 月运营日报图表"
-    default_title_1 = "日报推送折线图"
-    default_title_2 = "佩戴趋势折线图"
-    default_title_3 = "日报推送柱状图"
-    default_title_4 = "推送占比饼图"
+    # 粒度不放在表单里：切换后立即生效，只从已缓存的汇总中取数
+    granularity_label = st.sidebar.radio("📅 时间粒度", list(GRANULARITIES), horizontal=True,
+                                         help="按周为 ISO 周（周一至周日）；汇总每份数据只计算一次")
+    granularity = GRANULARITIES[granularity_label]
     
-    title_all = st.sidebar.text_input("总标题", default_title_all)
-    title_1 = st.sidebar.text_input("图表 1 标题", default_title_1)
-    title_2 = st.sidebar.text_input("图表 2 标题", default_title_2)
-    title_3 = st.sidebar.text_input("图表 3 标题", default_title_3)
-    title_4 = st.sidebar.text_input("图表 4 标题", default_title_4)
+    # 侧边栏设置放在表单中，一次编辑多个字段只在提交时重新渲染一次
+    settings = st.sidebar.form("chart_settings")
+    
+    # 标题设置
+    settings.subheader("📝 标题设置")
+    title_all = settings.text_input("总标题", DEFAULT_TITLE_ALL)
+    # 每张注册的图表一个标题输入框，顺序与整合截图一致
+    titles = [settings.text_input(f"图表 {i} 标题", spec.title, key=f"title_{spec.kind}")
+              for i, spec in enumerate(CHART_SPECS.values(), 1)]
     
     # 颜色设置
-    st.sidebar.subheader("🎨 颜色设置")
-    st.sidebar.markdown("*自定义图表颜色，打造专属风格*")
+    settings.subheader("🎨 颜色设置")
+    settings.markdown("*自定义图表颜色，打造专属风格*")
     
-    col1, col2 = st.sidebar.columns(2)
+    col1, col2 = settings.columns(2)
     with col1:
         color_push = st.color_picker("日报推送", "#2E7D32", help="推送数据的颜色")
         color_wear = st.color_picker("手表佩戴", "#1976D2", help="佩戴数据的颜色")
@@ -48,14 +183,27 @@ def main():
     }
     
     # 预设配色方案
-    st.sidebar.markdown("---")
-    st.sidebar.markdown("**快速配色方案**")
-    color_scheme = st.sidebar.selectbox(
+    settings.markdown("---")
+    settings.markdown("**快速配色方案**")
+    color_scheme = settings.selectbox(
         "选择预设方案",
         ["自定义", "商务专业", "清新活力", "沉稳大气", "科技蓝调"],
         help="选择预设配色方案或自定义"
     )
     
+    # 输出设置：编码结果同时用于页面展示和下载
+    settings.markdown("---")
+    settings.subheader("📦 输出设置")
+    format_label = settings.selectbox("图片格式", list(OUTPUT_FORMATS),
+                                      help="调色板 PNG 体积最小且几乎无损；WebP/JPEG 适合手机查看")
+    quality = settings.slider("压缩质量（WebP / JPEG）", 50, 100, DEFAULT_QUALITY)
+    dpi = settings.select_slider("分辨率 (DPI)", options=[100, 150, 200], value=150)
+    max_width = settings.number_input("最大宽度（像素，0 为不限制）", min_value=0, max_value=8000,
+                                      value=0, step=200)
+    display_mode = settings.radio("显示模式", list(DISPLAY_MODES),
+                                  help="交互式图表由浏览器绘制，整合截图在需要时再生成")
+    settings.form_submit_button("✅ 应用设置", use_container_width=True)
+    
     # 应用预设配色
     if color_scheme == "商务专业":
         colors = {'push': '#2E7D32', 'not_push': '#F57C00', 'wear': '#1976D2', 'not_wear': '#C62828'}
@@ -71,90 +219,214 @@ def main():
     st.markdown("### 上传 Excel 表格，自动生成专业级图表并输出整合截图")
     st.markdown("---")
     
-    uploaded_file = st.file_uploader("📁 请上传 Excel 文件", type=['xlsx', 'xls'], 
-                                      help="支持 .xlsx 和 .xls 格式")
+    source = DATA_SOURCES[st.radio("数据来源", list(DATA_SOURCES), horizontal=True)]
+    uploaded_file = None
+    date_range = None
+    if source == 'upload':
+        uploaded_file = st.file_uploader("📁 请上传 Excel 文件", type=['xlsx', 'xls', 'csv', 'parquet'], 
+                                          help="支持 .xlsx、.xls、.csv 和 .parquet 格式")
+        save_to_history = st.checkbox("保存到历史库", value=False,
+                                      help="写入本服务器上所有用户共用的本地历史库，之后可直接按日期范围出图；"
+                                           "库中已有的日期会被本次数据覆盖")
+    else:
+        import datetime
+        from history_store import get_store
+        span = get_store().date_range()
+        if span is None:
+            st.info("🗄️ 历史库为空，请先上传文件并勾选「保存到历史库」。")
+        else:
+            first, last = span
+            default_start = max(first, last - datetime.timedelta(days=HISTORY_DEFAULT_DAYS - 1))
+            picked = st.date_input("📅 日期范围", value=(default_start, last),
+                                   min_value=first, max_value=last)
+            # 选择过程中只选了开始日期时先不出图
+            if isinstance(picked, (tuple, list)) and len(picked) == 2:
+                date_range = tuple(picked)
     
-    if uploaded_file is not None:
+    if uploaded_file is not None or date_range is not None:
         # Progress Bar
         progress_bar = st.progress(0)
         status_text = st.empty()
         
         try:
-            # Step 1: Parsing
-            status_text.text("🔍 [##--------] 20% 正在解析数据...")
-            progress_bar.progress(20)
-            time.sleep(0.5)
-            
-            df = load_data(uploaded_file)
-            df = validate_columns(df)
-            df = preprocess_data(df)
+            from data_processor import calculate_stats
+            from pipeline import (colors_key, file_digest, load_frame, load_history, load_rollups,
+                                  render_groups, render_pdf, rollup_frame, save_history)
+            from instrumentation import hooks
             
-            # Step 2: Generating Charts
-            status_text.text("🎨 [######----] 60% 正在生成图表...")
-            progress_bar.progress(60)
+            # 进度条由流水线发出的阶段事件驱动
+            timings = []
+            on_stage = progress_hook(progress_bar, status_text, timings)
             
-            fig1 = generate_line_chart_1(df, title_1, colors)
-            fig2 = generate_line_chart_2(df, title_2, colors)
-            fig3 = generate_bar_chart(df, title_3, colors)
-            fig4 = generate_pie_chart(df, title_4, colors)
-            
-            # Step 3: Combining
-            status_text.text("🖼️ [#########-] 90% 正在整合图表...")
-            progress_bar.progress(90)
-            combined_img = combine_charts(fig1, fig2, fig3, fig4)
-            
-            status_text.text("✅ [##########] 100% 图表生成完成！")
-            progress_bar.progress(100)
-            time.sleep(0.5)
-            status_text.empty()
-            progress_bar.empty()
+            if date_range is not None:
+                # 历史库按日期索引做范围查询，同一范围在数据更新前复用缓存
+                digest, df = run_scheduled(('history',) + date_range, on_stage, load_history,
+                                           *date_range)
+            else:
+                # 解析结果按文件内容哈希缓存，修改侧边栏设置不会重新解析
+                data = uploaded_file.getvalue()
+                digest, df = run_scheduled(('load', file_digest(data)), on_stage, load_frame, data)
+                # 同一文件在本会话中只写入一次；会覆盖库中已有日期时先确认
+                if save_to_history and st.session_state.get('saved_digest') != digest:
+                    from history_store import get_store
+                    stored = get_store().stored_days(df)
+                    if stored and st.session_state.get('confirmed_digest') != digest:
+                        st.warning(f"⚠️ 历史库中已有其中 {len(stored)} 天（{stored[0]} ~ {stored[-1]}）的数据，"
+                                   "保存后这些日期的数据（含其他用户上传的）将被本文件替换。")
+                        st.button("🗄️ 确认覆盖并保存", on_click=st.session_state.__setitem__,
+                                  args=('confirmed_digest', digest))
+                    else:
+                        with hooks(on_stage):
+                            days = save_history(df)
+                        st.session_state['saved_digest'] = digest
+                        st.caption(f"🗄️ 已将 {days} 天数据保存到历史库"
+                                   + (f"，其中 {len(stored)} 天覆盖了原有数据" if stored else ""))
             
             # Display Stats
             stats = calculate_stats(df)
-            st.success(f"📊 数据分析：最近一周推送率稳定在 **{stats['push_rate']:.1f}%** 左右，佩戴率为 **{stats['wear_rate']:.1f}%**。")
+            coercions = df.attrs.get('coercions')
+            if coercions:
+                details = "、".join(f"{col} {count} 个" for col, count in coercions.items())
+                st.warning(f"⚠️ 部分单元格无法识别，数值已按 0 处理、日期保留原文：{details}")
+            st.success(summary_text(stats))
+            anomalies = {label: stats[f'{metric}_anomalies'] for metric, label in METRIC_LABELS.items()
+                         if stats[f'{metric}_anomalies']}
+            if anomalies:
+                details = "；".join(f"{label} {'、'.join(days)}" for label, days in anomalies.items())
+                st.info(f"🔎 波动异常的日期：{details}")
+            
+            # 按周/按月时图表使用预先汇总的数据；按日沿用原始数据
+            chart_digest, chart_df = digest, df
+            if granularity != 'day':
+                with hooks(on_stage):
+                    chart_digest, chart_df = rollup_frame(digest, df, granularity)
+                if chart_df.empty:
+                    st.warning(f"⚠️ 数据中没有可识别的日期，无法{granularity_label}汇总，已按原始数据出图。")
+                    chart_digest, chart_df = digest, df
             
             # Display Charts
             st.markdown("---")
             st.subheader("📊 生成结果")
             
             # 使用两列布局展示图表
-            col1, col2 = st.columns(2)
-            with col1:
-                st.pyplot(fig1)
-                st.pyplot(fig3)
-            with col2:
-                st.pyplot(fig2)
-                st.pyplot(fig4)
+            interactive = DISPLAY_MODES[display_mode] == 'web'
+            if interactive:
+                # 交互模式：只发送（降采样后的）数据，由浏览器绘制
+                from web_charts import build_specs
+                with hooks(on_stage):
+                    specs = build_specs(chart_df, titles, colors)
+                columns = st.columns(2)
+                for i, spec in enumerate(specs):
+                    with columns[i % 2]:
+                        st.vega_lite_chart(spec, use_container_width=True)
+            else:
+                # 图片模式：图表在下方与整合截图一起渲染后填入此处
+                chart_slot = st.container()
             
             st.markdown("---")
             st.subheader("🖼️ 整合截图（用于汇报）")
-            st.image(combined_img, caption=title_all, use_column_width=True)
+            # 交互模式下整合截图按需生成，同一份数据点击一次后保持显示
+            if interactive and st.session_state.get('composite_digest') != digest:
+                st.button("🖼️ 生成整合截图", on_click=st.session_state.__setitem__,
+                          args=('composite_digest', digest))
+            
+            if not interactive or st.session_state.get('composite_digest') == digest:
+                # 每张图按 (数据哈希, 图表类型, 标题, 颜色, DPI) 缓存，只重绘发生变化的图表；
+                # 每种输出只编码一次，页面展示与下载共用同一份字节
+                output = (OUTPUT_FORMATS[format_label], quality, max_width or None, dpi)
+                # 交互模式只需要整合截图，不渲染单张图表
+                chart_images, combined_img = run_scheduled(
+                    ('report', chart_digest, tuple(titles), colors_key(colors), interactive) + output,
+                    on_stage, build_report, chart_digest, chart_df, titles, colors, *output,
+                    not interactive)
+                
+                if not interactive:
+                    with chart_slot:
+                        columns = st.columns(2)
+                        for i, image in enumerate(chart_images):
+                            with columns[i % 2]:
+                                st.image(image.data, use_column_width=True)
+                
+                st.image(combined_img.data, caption=title_all, use_column_width=True)
+                
+                # Download Button
+                col_download1, col_download2, col_download3 = st.columns([1, 1, 2])
+                with col_download1:
+                    st.download_button(
+                        label=f"⬇️ 下载整合截图 ({combined_img.extension.upper()}, {len(combined_img) / 1024:.0f} KB)",
+                        data=combined_img.data,
+                        file_name=f"chart_summary.{combined_img.extension}",
+                        mime=combined_img.mime,
+                        use_container_width=True
+                    )
             
-            # Download Button
-            buf = io.BytesIO()
-            combined_img.save(buf, format="PNG")
-            byte_im = buf.getvalue()
+            with st.expander(f"📋 {granularity_label}汇总数据"):
+                with hooks(on_stage):
+                    rollup = load_rollups(digest, df)[granularity]
+                st.dataframe(rollup.rename(columns=ROLLUP_LABELS), use_container_width=True)
             
-            col_download1, col_download2, col_download3 = st.columns([1, 1, 2])
-            with col_download1:
+            # 月末汇报用的多页 PDF（总览 + 每周或每个部门一页），点击后才生成
+            from data_processor import GROUP_COLUMN
+            from pdf_report import PAGE_MODES
+            st.markdown("---")
+            st.subheader("📄 PDF 报告")
+            page_modes = {label: by for by, label in PAGE_MODES.items()
+                          if by != 'group' or GROUP_COLUMN in df.columns}
+            page_label = st.radio("分页方式", list(page_modes), horizontal=True)
+            pdf_key = (digest, page_modes[page_label], tuple(titles), colors_key(colors), title_all)
+            if st.session_state.get('pdf_key') != pdf_key:
+                st.button("📄 生成 PDF 报告", on_click=st.session_state.__setitem__,
+                          args=('pdf_key', pdf_key))
+            else:
+                pdf_data, pages = run_scheduled(('pdf',) + pdf_key, on_stage, render_pdf, digest, df,
+                                                titles, colors, page_modes[page_label], title_all)
                 st.download_button(
-                    label="⬇️ 下载整合截图 (PNG)",
-                    data=byte_im,
-                    file_name="chart_summary.png",
-                    mime="image/png",
-                    use_container_width=True
+                    label=f"⬇️ 下载 PDF 报告（{pages} 页，{len(pdf_data) / 1024:.0f} KB）",
+                    data=pdf_data,
+                    file_name="chart_report.pdf",
+                    mime="application/pdf",
                 )
             
+            # 含部门/团队列时，按组生成一张小图汇总
+            if GROUP_COLUMN in df.columns:
+                st.markdown("---")
+                st.subheader(f"🏢 分{GROUP_COLUMN}小图")
+                col_metric, col_style = st.columns(2)
+                with col_metric:
+                    metric_label = st.radio("指标", list(METRIC_LABELS.values()), horizontal=True)
+                with col_style:
+                    style_label = st.radio("图表类型", list(GROUP_STYLES), horizontal=True)
+                metric = next(m for m, label in METRIC_LABELS.items() if label == metric_label)
+                
+                group_title = f"各{GROUP_COLUMN}{metric_label}"
+                group_image = run_scheduled(
+                    ('groups', digest, group_title, colors_key(colors), metric, GROUP_STYLES[style_label]),
+                    on_stage, render_groups, digest, df, group_title, colors,
+                    metric, GROUP_STYLES[style_label])
+                st.image(group_image, use_column_width=True)
+            
+            status_text.empty()
+            progress_bar.empty()
+            
+            with st.expander("⏱️ 处理耗时明细"):
+                st.dataframe(timings, use_container_width=True)
+            
+        except SchedulerBusy:
+            st.warning("⏳ 服务器繁忙，当前生成任务较多，请稍后重新提交。")
+        except Cancelled:
+            # 同一会话已提交了更新的请求，本次结果作废
+            st.info("🔄 设置已变更，正在按最新设置重新生成…")
         except ValueError as e:
             st.error(f"❌ 数据格式错误：{str(e)}")
         except Exception as e:
             st.error(f"❌ 发生未知错误：{e}")
-    else:
+    elif source == 'upload':
         # 显示使用说明
         st.info("👆 请上传包含以下列的 Excel 文件：**日期**、**日报推送**、**日报未推送**、**手表佩戴**（或腕表佩戴）、**手表未佩戴**（或腕表未佩戴）")
         
         # 显示示例
         with st.expander("📋 查看数据格式示例"):
+            import pandas as pd
             example_data = {
                 '日期': ['2025.11.25', '2025.11.26', '2025.11.27'],
                 '腕表未佩戴': [266, 287, 271],
@@ -164,5 +436,8 @@ def main():
             }
             st.dataframe(pd.DataFrame(example_data), use_container_width=True)
 
+    # 页面内容输出后再预热，首屏不必等待 matplotlib 导入
+    preload_pipeline()
+
 if __name__ == "__main__":
     main()
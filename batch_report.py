@@ -0,0 +1,190 @@
+"""
+Headless batch report generation.
+
+Runs the data_processor -> chart_generator.generate_panels pipeline for
+many workbooks across a process pool and writes, per input, a composite
+PNG and a stats JSON file.
+
+Usage:
+    python batch_report.py reports/ "exports/*.xlsx" -o out/ -w 4
+    python batch_report.py monthly.xlsx --all-sheets
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chart_specs import CHART_KINDS
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xlsm', '.xls', '.csv', '.parquet')
+
+
+def expand_inputs(patterns):
+    """
+    Expands files, directories and glob patterns into a sorted list of paths.
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern) or [pattern]
+        for path in candidates:
+            name = os.path.basename(path)
+            # 跳过 Excel 打开文件时生成的 ~$ 锁文件
+            if name.startswith('~$') or not name.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            paths.append(os.path.abspath(path))
+    return sorted(set(paths))
+
+
+def output_stem(path, sheet, out_dir):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if sheet is not None:
+        stem = f"{stem}_{sheet}"
+    return os.path.join(out_dir or os.path.dirname(path), stem)
+
+
+def _to_builtin(value):
+    # numpy 标量转为 JSON 可序列化的内置类型
+    return value.item() if hasattr(value, 'item') else value
+
+
+def process_one(path, sheet, out_dir, titles, colors, output=None):
+    """
+    Runs the full pipeline for one workbook (or sheet) and writes its outputs.
+    `output` holds utils.encode_image options (fmt, quality, max_width) for
+    the composite; the default is a lossless PNG.
+    Returns a summary dict; errors are reported rather than raised.
+    """
+    from utils import encode_image
+    from data_processor import GROUP_COLUMN, calculate_stats
+    from pipeline import load_frame, render_groups, render_panels
+    from PIL import Image
+
+    start = time.perf_counter()
+    summary = {'input': path, 'sheet': sheet}
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest, df = load_frame(data, sheet=sheet)
+        # 只需要整合截图：所有图表作为同一图表的面板一次绘制
+        combined = render_panels(digest, df, titles, colors)
+
+        stem = output_stem(path, sheet, out_dir)
+        encoded = encode_image(combined, **(output or {}))
+        image_path = f"{stem}_report.{encoded.extension}"
+        with open(image_path, 'wb') as f:
+            f.write(encoded.data)
+
+        stats = {key: _to_builtin(value) for key, value in calculate_stats(df).items()}
+        stats.update({'rows': len(df), 'coercions': df.attrs.get('coercions', {})})
+
+        # 含分组列时额外输出一张分组小图
+        if GROUP_COLUMN in df.columns:
+            groups_path = f"{stem}_groups.png"
+            Image.fromarray(render_groups(digest, df, f"各{GROUP_COLUMN}日报推送", colors)).save(groups_path)
+            summary['groups_image'] = groups_path
+            stats['groups'] = int(df[GROUP_COLUMN].nunique())
+        stats_path = f"{stem}_stats.json"
+        with open(stats_path, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+
+        summary.update({'ok': True, 'rows': len(df), 'bytes': len(data),
+                        'image': image_path, 'stats': stats_path})
+    except Exception as e:
+        summary.update({'ok': False, 'error': str(e)})
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def _init_worker():
+    from fonts import setup_fonts
+    setup_fonts()
+
+
+def build_jobs(paths, all_sheets):
+    from data_processor import list_sheets
+
+    jobs = []
+    for path in paths:
+        sheets = [None]
+        if all_sheets:
+            try:
+                sheets = list_sheets(path)
+            except Exception as e:
+                print(f"Cannot list sheets of {path}: {e}", file=sys.stderr)
+        jobs.extend((path, sheet) for sheet in sheets)
+    return jobs
+
+
+def run_batch(jobs, out_dir=None, workers=1, titles=None, colors=None, output=None):
+    """
+    Processes (path, sheet) jobs, in-process when workers == 1, otherwise
+    on a process pool. Yields one summary dict per job as it completes.
+    """
+    from chart_generator import DEFAULT_TITLES
+
+    titles = titles or DEFAULT_TITLES
+    if workers <= 1:
+        _init_worker()
+        for path, sheet in jobs:
+            yield process_one(path, sheet, out_dir, titles, colors, output)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(process_one, path, sheet, out_dir, titles, colors, output)
+                   for path, sheet in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate chart reports for many workbooks")
+    parser.add_argument('inputs', nargs='+', help="workbook files, directories or glob patterns")
+    parser.add_argument('-o', '--out-dir', help="output directory (default: next to each input)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument('--all-sheets', action='store_true',
+                        help="render every sheet of each workbook instead of the first")
+    parser.add_argument('--titles', nargs=len(CHART_KINDS), metavar='TITLE',
+                        help=f"titles of the {len(CHART_KINDS)} charts, in {', '.join(CHART_KINDS)} order")
+    parser.add_argument('--format', choices=['png', 'png8', 'webp', 'jpeg'], default='png',
+                        help="composite image format (png8 = palette-quantized PNG)")
+    parser.add_argument('--quality', type=int, default=85, help="WebP/JPEG quality (1-100)")
+    parser.add_argument('--max-width', type=int, help="downscale composites wider than this")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error("no workbooks matched the given inputs")
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    jobs = build_jobs(paths, args.all_sheets)
+    workers = max(1, min(args.workers, len(jobs)))
+
+    start = time.perf_counter()
+    results = []
+    output = {'fmt': args.format, 'quality': args.quality, 'max_width': args.max_width}
+    for summary in run_batch(jobs, args.out_dir, workers, args.titles, output=output):
+        results.append(summary)
+        label = summary['input'] if summary['sheet'] is None else f"{summary['input']} [{summary['sheet']}]"
+        if summary['ok']:
+            print(f"✓ {label}: {summary['rows']} rows in {summary['seconds']:.2f}s -> {summary['image']}")
+        else:
+            print(f"✗ {label}: {summary['error']}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    succeeded = [r for r in results if r['ok']]
+    rows = sum(r['rows'] for r in succeeded)
+    print(f"\n{len(succeeded)}/{len(results)} reports in {elapsed:.2f}s with {workers} worker(s): "
+          f"{len(results) / elapsed:.2f} reports/s, {rows / elapsed:.0f} rows/s")
+    return 0 if len(succeeded) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Reproducible benchmark of the ingest -> render -> composite pipeline.
+
+Generates synthetic workbooks (see create_dummy_data.make_frame), then times
+and memory-profiles every stage separately: probe_headers, load_data with
+that probe, validate_columns, preprocess_data, then both composite paths.
+Image mode (pipeline.render_report) draws each chart function, rasterizes it
+and joins the rasters with combine_charts; batch, API, watch folder and
+interactive mode (pipeline.render_panels) draw one multi-panel figure with
+generate_panels. Each composite is PNG-encoded. Timings are the median of --repeat runs; peak memory comes from one
+extra run under tracemalloc so tracing does not distort the timings.
+
+Usage:
+    python bench_pipeline.py --rows 10 1000 100000 --json after.json
+    python bench_pipeline.py --rows 10 1000 100000 --compare before.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+
+from create_dummy_data import HEADER_VARIANTS, make_frame, write_frame
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ensure_dataset(data_dir, rows, extra_columns, variant, missing_rate, fmt):
+    """
+    Returns the path of a generated dataset, writing it on first use.
+    """
+    name = f"bench_{rows}r_{extra_columns}c_{variant}_{missing_rate:g}m.{fmt}"
+    path = os.path.join(data_dir, name)
+    # 生成的数据集按参数命名并复用，大文件只写一次
+    if not os.path.exists(path):
+        write_frame(make_frame(rows, extra_columns, variant, missing_rate), path)
+    return path
+
+
+def run_stages(path, measure):
+    """
+    Runs every pipeline stage once on `path`. Each stage is executed through
+    measure(stage, func, *args), which returns the stage's result.
+    """
+    from data_processor import probe_headers, load_data, validate_columns, preprocess_data
+    from chart_generator import CHART_FUNCTIONS, DEFAULT_TITLES, generate_panels
+    from utils import combine_charts, figure_to_array, figure_to_image, release_figure
+
+    probe = measure('probe_headers', probe_headers, path)
+    df = measure('load_data', partial(load_data, probe=probe), path)
+    df = measure('validate_columns', validate_columns, df)
+    df = measure('preprocess_data', preprocess_data, df)
+
+    # 图片模式（pipeline.render_report）：逐张绘制并光栅化，再拼接
+    arrays = []
+    for (kind, func), title in zip(CHART_FUNCTIONS.items(), DEFAULT_TITLES):
+        fig = measure(f'chart:{kind}', func, df, title)
+        arrays.append(measure(f'rasterize:{kind}', figure_to_array, fig))
+        release_figure(fig)
+
+    combined = measure('combine_charts', combine_charts, *arrays)
+    measure('png_encode', combined.save, io.BytesIO(), 'PNG')
+
+    # 只要整合截图的入口（pipeline.render_panels）：所有图表作为一张图的子图一次绘制
+    fig = measure('render_panels', generate_panels, df, DEFAULT_TITLES)
+    try:
+        panels = measure('rasterize:panels', figure_to_image, fig)
+    finally:
+        release_figure(fig)
+    measure('png_encode:panels', panels.save, io.BytesIO(), 'PNG')
+
+
+def time_stages(path):
+    timings = {}
+
+    def measure(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    run_stages(path, measure)
+    return timings
+
+
+def peak_memory(path):
+    peaks = {}
+
+    def measure(stage, func, *args):
+        # 记录相对阶段开始时的增量峰值，不计入前面阶段仍持有的内存
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = func(*args)
+        peaks[stage] = tracemalloc.get_traced_memory()[1] - baseline
+        return result
+
+    tracemalloc.start()
+    try:
+        run_stages(path, measure)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def benchmark(path, repeat):
+    """
+    Returns {stage: {'seconds': median, 'peak_bytes': peak}} for one dataset.
+    """
+    # 预热一次：字体配置与模块导入不计入阶段耗时
+    time_stages(path)
+    runs = [time_stages(path) for _ in range(repeat)]
+    peaks = peak_memory(path)
+    return {stage: {'seconds': statistics.median(run[stage] for run in runs),
+                    'peak_bytes': peaks.get(stage)}
+            for stage in runs[0]}
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    old = {(r['dataset'], r['stage']): r for r in baseline['results']}
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('commit')}):")
+    for r in results:
+        before = old.get((r['dataset'], r['stage']))
+        if before and before['seconds'] > 0:
+            ratio = r['seconds'] / before['seconds']
+            print(f"{r['dataset']:>32} {r['stage']:<22} {before['seconds'] * 1000:9.1f} -> "
+                  f"{r['seconds'] * 1000:9.1f} ms  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the report pipeline stage by stage")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--extra-columns', type=int, default=20)
+    parser.add_argument('--variant', choices=HEADER_VARIANTS, default='腕表')
+    parser.add_argument('--missing-rate', type=float, default=0.01)
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'chart_bench'))
+    parser.add_argument('--json', help="write machine-readable results to this file")
+    parser.add_argument('--compare', help="baseline JSON from a previous run")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for rows in args.rows:
+        path = ensure_dataset(args.data_dir, rows, args.extra_columns, args.variant,
+                              args.missing_rate, args.format)
+        dataset = os.path.basename(path)
+        print(f"\n{dataset}")
+        for stage, result in benchmark(path, args.repeat).items():
+            results.append({'dataset': dataset, 'rows': rows, 'stage': stage, **result})
+            print(f"  {stage:<22} {result['seconds'] * 1000:9.1f} ms  "
+                  f"peak {result['peak_bytes'] / 1024 / 1024:8.2f} MiB")
+
+    if args.json:
+        import matplotlib
+        import pandas as pd
+        meta = {'commit': _git_commit(), 'python': platform.python_version(),
+                'platform': platform.platform(), 'pandas': pd.__version__,
+                'matplotlib': matplotlib.__version__, 'repeat': args.repeat,
+                'format': args.format, 'extra_columns': args.extra_columns,
+                'variant': args.variant, 'missing_rate': args.missing_rate}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
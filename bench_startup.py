@@ -0,0 +1,61 @@
+"""
+Measures cold start-up time of the chart pipeline.
+
+Each sample runs in a fresh interpreter so module imports and font setup are
+measured the way a new server or worker process pays for them.
+
+Usage: python bench_startup.py [--runs 5] [--json startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# 在子进程中逐阶段计时，输出一行 JSON
+PROBE = r'''
+import json, time
+t0 = time.perf_counter()
+import pipeline
+t1 = time.perf_counter()
+from fonts import setup_fonts
+setup_fonts()
+t2 = time.perf_counter()
+from chart_generator import new_figure
+new_figure()
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "fonts": t2 - t1, "first_figure": t3 - t2, "total": t3 - t0}))
+'''
+
+STAGES = ['import', 'fonts', 'first_figure', 'total']
+
+
+def run_once():
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=here,
+                            capture_output=True, text=True, check=True)
+    # 最后一行是计时结果，之前可能有字体配置日志
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure pipeline start-up time")
+    parser.add_argument('--runs', type=int, default=5, help="number of fresh processes")
+    parser.add_argument('--json', help="write the samples and medians to this file")
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    medians = {stage: statistics.median(s[stage] for s in samples) for stage in STAGES}
+
+    for stage in STAGES:
+        print(f"{stage:>13}: {medians[stage] * 1000:8.1f} ms (median of {args.runs})")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'runs': args.runs, 'median': medians, 'samples': samples}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,123 +1,23 @@
+import math
+import threading
+from functools import partial
+
+import numpy as np
+import pandas as pd
 import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import platform
-import os
-import sys
-
-# 设置 Matplotlib 后端（在导入 pyplot 之前）
-matplotlib.use('Agg')
-
-print(f"=== Font Initialization for {platform.system()} ===")
-
-# 强制清除字体缓存
-def clear_font_cache():
-    try:
-        cache_dir = matplotlib.get_cachedir()
-        print(f"Cache directory: {cache_dir}")
-        
-        # 尝试删除所有字体缓存文件
-        cache_files = [
-            'fontlist-v330.json',
-            'fontlist-v320.json', 
-            'fontlist-v310.json'
-        ]
-        
-        for cache_file in cache_files:
-            cache_path = os.path.join(cache_dir, cache_file)
-            if os.path.exists(cache_path):
-                os.remove(cache_path)
-                print(f"✓ Removed cache: {cache_file}")
-    except Exception as e:
-        print(f"Cache clear warning: {e}")
-
-clear_font_cache()
-
-# 重建字体管理器
-try:
-    fm._rebuild()
-    print("✓ Font manager rebuilt")
-except Exception as e:
-    print(f"Font rebuild warning: {e}")
-
-# 配置中文字体
-def setup_fonts():
-    system = platform.system()
-    
-    if system == "Linux":
-        # Streamlit Cloud / Linux
-        print("Configuring for Linux/Streamlit Cloud...")
-        
-        # 方法1：直接加载字体文件
-        font_paths = [
-            '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
-            '/usr/share/fonts/truetype/wqy-microhei/wqy-microhei.ttc',
-            '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
-            '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
-            '/usr/share/fonts/truetype/noto-cjk/NotoSansCJK-Regular.ttc',
-        ]
-        
-        font_loaded = False
-        for font_path in font_paths:
-            if os.path.exists(font_path):
-                try:
-                    # 直接注册字体
-                    fm.fontManager.addfont(font_path)
-                    prop = fm.FontProperties(fname=font_path)
-                    font_name = prop.get_name()
-                    
-                    # 设置为默认字体
-                    plt.rcParams['font.family'] = 'sans-serif'
-                    plt.rcParams['font.sans-serif'] = [font_name] + plt.rcParams.get('font.sans-serif', [])
-                    
-                    print(f"✓✓✓ SUCCESS: Loaded {font_name} from {font_path}")
-                    font_loaded = True
-                    break
-                except Exception as e:
-                    print(f"Failed to load {font_path}: {e}")
-        
-        if not font_loaded:
-            print("⚠ No font file loaded, using font names")
-            plt.rcParams['font.sans-serif'] = [
-                'WenQuanYi Micro Hei',
-                'WenQuanYi Zen Hei', 
-                'Noto Sans CJK SC',
-                'DejaVu Sans'
-            ]
-    
-    elif system == "Windows":
-        # Windows
-        print("Configuring for Windows...")
-        font_paths = [
-            r'C:\Windows\Fonts\msyh.ttc',
-            r'C:\Windows\Fonts\simhei.ttf',
-        ]
-        
-        for font_path in font_paths:
-            if os.path.exists(font_path):
-                try:
-                    fm.fontManager.addfont(font_path)
-                    prop = fm.FontProperties(fname=font_path)
-                    font_name = prop.get_name()
-                    plt.rcParams['font.family'] = 'sans-serif'
-                    plt.rcParams['font.sans-serif'] = [font_name] + plt.rcParams.get('font.sans-serif', [])
-                    print(f"✓✓✓ SUCCESS: Loaded {font_name}")
-                    break
-                except Exception as e:
-                    print(f"Failed: {e}")
-    
-    else:
-        # macOS
-        plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'PingFang SC']
-    
-    # 解决负号显示
-    plt.rcParams['axes.unicode_minus'] = False
-    
-    # 打印最终配置
-    print(f"Final font.sans-serif: {plt.rcParams['font.sans-serif'][:3]}")
-    print("=== Font Initialization Complete ===\n")
-
-setup_fonts()
+import matplotlib.dates as mdates
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import to_rgb
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.patches import Shadow
+from matplotlib.ticker import FixedLocator, FuncFormatter, MaxNLocator
+
+from fonts import setup_fonts
+# 图表注册表放在不依赖 matplotlib 的模块中，应用启动时即可读取默认标题
+from chart_specs import (CHART_KINDS, CHART_SPECS, DEFAULT_TITLE_ALL,  # noqa: F401
+                         DEFAULT_TITLES, ChartSpec)
+from analytics import aggregate, group_daily, has_groups
 
 # 统一的图表尺寸
 FIGURE_SIZE = (10, 7)
@@ -129,6 +29,34 @@ LABEL_FONTSIZE = 13
 TICK_FONTSIZE = 11
 LEGEND_FONTSIZE = 12
 
+# 大数据量模式：行数超过阈值后改用数值日期轴、折线降采样、柱状图按周/月汇总
+LARGE_SERIES_THRESHOLD = 60
+# 折线图每条曲线降采样后的最大点数（LTTB）
+DOWNSAMPLE_POINTS = 400
+# 点数超过该值时不绘制数据点标记
+MARKER_THRESHOLD = 60
+# 柱状图汇总后的最大分组数，以及最多显示的刻度标签数
+BAR_MAX_BINS = 60
+MAX_TICK_LABELS = 20
+# 柱状图汇总粒度：(resample 规则, 每组约多少天, 标签格式, 单位)
+BAR_BIN_RULES = [
+    ('W-MON', 7, '%m-%d', '周'),
+    ('MS', 30.4, '%Y-%m', '月'),
+    ('QS', 91.3, '%Y-%m', '季度'),
+    ('YS', 365.25, '%Y', '年'),
+]
+
+# 分组小图：每个面板的尺寸（英寸）、每行最多面板数、每条曲线最多点数
+PANEL_SIZE = (3.6, 2.6)
+GRID_MAX_COLUMNS = 6
+PANEL_POINTS = 120
+PANEL_TITLE_FONTSIZE = 11
+# 小图可选的指标：(列名, 颜色键)
+SMALL_MULTIPLE_SERIES = {
+    'push': [('日报推送', 'push'), ('日报未推送', 'not_push')],
+    'wear': [('手表佩戴', 'wear'), ('手表未佩戴', 'not_wear')],
+}
+
 # 默认颜色方案
 DEFAULT_COLORS = {
     'push': '#2E7D32',
@@ -137,143 +65,450 @@ DEFAULT_COLORS = {
     'not_wear': '#C62828'
 }
 
-def generate_line_chart_1(df, title, colors=None):
-    """Chart 1: Daily Report Push Line Chart"""
-    if colors is None:
-        colors = DEFAULT_COLORS
-    
-    fig, ax = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI)
-    ax.set_facecolor('#F8F9FA')
+# 各图表共用的样式参数，只构建一次
+TITLE_STYLE = {'fontsize': TITLE_FONTSIZE, 'fontweight': 'bold', 'pad': 20}
+AXIS_LABEL_STYLE = {'fontsize': LABEL_FONTSIZE, 'fontweight': 'bold'}
+GRID_STYLE = {'linestyle': '--', 'alpha': 0.3, 'linewidth': 1}
+LEGEND_STYLE = {'fontsize': LEGEND_FONTSIZE, 'frameon': True, 'shadow': True,
+                'fancybox': True, 'loc': 'best'}
+AXES_FACECOLOR = '#F8F9FA'
+SEPARATOR_COLOR = '#E0E0E0'
+# 多面板图的总标题字号及其占用的高度（英寸）
+SUPTITLE_FONTSIZE = 22
+SUPTITLE_MARGIN = 0.8
+
+def new_figure(figsize=FIGURE_SIZE, **subplots):
+    """
+    Creates a standalone Agg-backed figure with one axes (or a grid of axes
+    when `subplots` arguments such as nrows/ncols are given).
+    The figure is not registered with pyplot, so it is never kept alive by
+    pyplot's figure manager and is safe to build from concurrent threads.
+    """
+    # 首次创建图表时才配置字体，导入本模块不做任何字体探测
+    setup_fonts()
+    fig = Figure(figsize=figsize, dpi=DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots(**subplots)
+    return fig, ax
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Returns the indices of n_out points that preserve the visual shape of y(x).
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    # 首尾点固定保留，中间点平均分入 n_out - 2 个桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        # 下一个桶的平均点作为三角形的第三个顶点
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+
+        area = np.abs((x[previous] - avg_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (avg_y - y[previous]))
+        previous = start + int(area.argmax())
+        indices[bucket + 1] = previous
+    return indices
+
+def _has_date_index(df):
+    # preprocess_data 把解析后的日期放在索引上；存在无法解析的日期时退回分类轴
+    return isinstance(df.index, pd.DatetimeIndex) and len(df) > 0 and not df.index.hasnans
+
+def _thin_ticks(ax, labels):
+    # 按位置显示刻度，标签过多时只保留一部分
+    step = max(1, math.ceil(len(labels) / MAX_TICK_LABELS))
+    positions = list(range(0, len(labels), step))
+    ax.set_xticks(positions)
+    ax.set_xticklabels([labels[i] for i in positions], rotation=45, ha='right')
+
+def _plot_lines(ax, df, series, colors):
+    """
+    Plots (column, color key, marker) series against the date column; each
+    line is tagged with its color key as gid so it can be recolored later.
+    Large series are downsampled with LTTB onto a numeric date axis.
+    """
+    if len(df) <= LARGE_SERIES_THRESHOLD:
+        show_markers = len(df) <= MARKER_THRESHOLD
+        for column, key, marker in series:
+            ax.plot(df['日期'], df[column],
+                    marker=marker if show_markers else None, markersize=8, color=colors[key],
+                    label=column, linewidth=3, alpha=0.9, gid=key)
+        for label in ax.get_xticklabels():
+            label.set(rotation=45, ha='right')
+        return
+
+    use_dates = _has_date_index(df)
+    frame = df.sort_index() if use_dates else df
+    x = frame.index.to_numpy() if use_dates else np.arange(len(frame))
+    x_numeric = mdates.date2num(x) if use_dates else x
+
+    for column, key, marker in series:
+        y = frame[column].to_numpy()
+        keep = lttb_indices(x_numeric, y, DOWNSAMPLE_POINTS)
+        ax.plot(x[keep], y[keep],
+                marker=marker if len(keep) <= MARKER_THRESHOLD else None, markersize=8,
+                color=colors[key], label=column, linewidth=2, alpha=0.9, gid=key)
+
+    if use_dates:
+        locator = mdates.AutoDateLocator(maxticks=MAX_TICK_LABELS)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    else:
+        labels = list(frame['日期'])
+        ax.xaxis.set_major_locator(MaxNLocator(nbins=MAX_TICK_LABELS, integer=True))
+        ax.xaxis.set_major_formatter(FuncFormatter(
+            lambda value, pos: labels[int(value)] if 0 <= int(value) < len(labels) else ''))
+        for label in ax.get_xticklabels():
+            label.set(rotation=45, ha='right')
+
+def _chart_frame(df):
+    # 含分组列时先按日汇总，主图表展示全部分组的合计
+    return aggregate(df).daily_frame() if has_groups(df) else df
+
+def _bin_rule(span_days):
+    # 选择分组数不超过 BAR_MAX_BINS 的最细粒度
+    for rule in BAR_BIN_RULES:
+        if span_days / rule[1] <= BAR_MAX_BINS:
+            return rule
+    return BAR_BIN_RULES[-1]
+
+def _bar_bins(df, columns):
+    """
+    Returns (labels, values, unit) for the bar chart. Large series are summed
+    into weekly or monthly bins (or fixed-size row chunks without dates).
+    """
+    if len(df) <= LARGE_SERIES_THRESHOLD:
+        return list(df['日期']), df[columns], None
+
+    if _has_date_index(df):
+        frame = df[columns].sort_index()
+        rule, _, fmt, unit = _bin_rule((frame.index[-1] - frame.index[0]).days)
+        binned = frame.resample(rule, label='left', closed='left').sum()
+        if unit == '周' and binned.index[0].year != binned.index[-1].year:
+            fmt = '%Y-%m-%d'
+        return list(binned.index.strftime(fmt)), binned, unit
+
+    chunk = math.ceil(len(df) / BAR_MAX_BINS)
+    groups = np.arange(len(df)) // chunk
+    binned = df[columns].groupby(groups).sum()
+    return list(df['日期'].iloc[::chunk]), binned, f'{chunk} 行'
+
+def _draw_line(ax, spec, df, colors):
+    _plot_lines(ax, _chart_frame(df), spec.series, colors)
+    ax.grid(True, **GRID_STYLE)
+    return '日期'
+
+def _draw_bar(ax, spec, df, colors):
+    # 数据量大时按周/月汇总，避免每天两根柱子挤在一起
+    labels, values, unit = _bar_bins(_chart_frame(df), spec.columns)
+    x = np.arange(len(labels))
+    width = 0.7 / len(spec.series)
+    for index, (column, key, _) in enumerate(spec.series):
+        offset = (index - (len(spec.series) - 1) / 2) * width
+        ax.bar(x + offset, values[column], width, label=column, color=colors[key], gid=key,
+               edgecolor='white', linewidth=1.5, alpha=0.9)
+    ax.yaxis.grid(True, **GRID_STYLE)
+    _thin_ticks(ax, labels)
+    return '日期' if unit is None else f'日期（按{unit}汇总）'
+
+def _draw_pie(ax, spec, df, colors):
+    # 合计与摘要统计共用同一份聚合结果
+    totals = aggregate(df).totals
+    sizes = [totals[column] for column in spec.columns]
+    total = sum(sizes)
+
+    def autopct(pct):
+        return "{:.1f}%\n({:d})".format(pct, int(round(pct / 100. * total)))
+
+    wedges, texts, autotexts = ax.pie(sizes, explode=[0.05] * len(sizes), labels=spec.columns,
+                                      colors=[colors[key] for _, key, _ in spec.series],
+                                      autopct=autopct, shadow=True, startangle=90,
+                                      textprops={'fontsize': TICK_FONTSIZE, 'fontweight': 'bold'})
+    for wedge, (_, key, _) in zip(wedges, spec.series):
+        wedge.set_gid(key)
+    for autotext in autotexts:
+        autotext.set(color='white', **AXIS_LABEL_STYLE)
+    for text in texts:
+        text.set(**AXIS_LABEL_STYLE)
+
+# 图表样式 -> 绘制函数；坐标轴类图表返回 x 轴标签
+CHART_DRAWERS = {
+    'line': _draw_line,
+    'bar': _draw_bar,
+    'pie': _draw_pie,
+}
+
+def draw_chart(ax, spec, df, title, colors=None):
+    """
+    Draws the chart described by `spec` onto an existing axes.
+    """
+    colors = colors or DEFAULT_COLORS
+    if spec.style == 'pie':
+        _draw_pie(ax, spec, df, colors)
+    else:
+        ax.set_facecolor(AXES_FACECOLOR)
+        xlabel = CHART_DRAWERS[spec.style](ax, spec, df, colors)
+        ax.set_axisbelow(True)
+        ax.set_xlabel(xlabel, **AXIS_LABEL_STYLE)
+        ax.set_ylabel('数量', **AXIS_LABEL_STYLE)
+        ax.tick_params(axis='both', which='major', labelsize=TICK_FONTSIZE)
+        ax.legend(**LEGEND_STYLE)
+    ax.set_title(title, **TITLE_STYLE)
+
+def generate_chart(kind, df, title, colors=None):
+    """
+    Builds a standalone figure for one registered chart kind.
+    """
+    spec = CHART_SPECS[kind]
+    fig, ax = new_figure()
     fig.patch.set_facecolor('white')
-    
-    ax.plot(df['日期'], df['日报推送'], 
-            marker='o', markersize=8, color=colors['push'], 
-            label='日报推送', linewidth=3, alpha=0.9)
-    ax.plot(df['日期'], df['日报未推送'], 
-            marker='s', markersize=8, color=colors['not_push'], 
-            label='日报未推送', linewidth=3, alpha=0.9)
-    
-    ax.grid(True, linestyle='--', alpha=0.3, linewidth=1)
-    ax.set_axisbelow(True)
-    
-    ax.set_title(title, fontsize=TITLE_FONTSIZE, fontweight='bold', pad=20)
-    ax.set_xlabel('日期', fontsize=LABEL_FONTSIZE, fontweight='bold')
-    ax.set_ylabel('数量', fontsize=LABEL_FONTSIZE, fontweight='bold')
-    
-    ax.tick_params(axis='both', which='major', labelsize=TICK_FONTSIZE)
-    plt.xticks(rotation=45, ha='right')
-    
-    ax.legend(fontsize=LEGEND_FONTSIZE, frameon=True, shadow=True, 
-              fancybox=True, loc='best')
-    
-    plt.tight_layout()
+    draw_chart(ax, spec, df, title, colors)
+    if spec.style == 'pie':
+        fig.subplots_adjust(left=0.15, right=0.85, top=0.92, bottom=0.08)
+    else:
+        fig.tight_layout()
     return fig
 
+def generate_line_chart_1(df, title, colors=None):
+    """Chart 1: Daily Report Push Line Chart"""
+    return generate_chart('line_push', df, title, colors)
+
 def generate_line_chart_2(df, title, colors=None):
     """Chart 2: Watch Wear Line Chart"""
-    if colors is None:
-        colors = DEFAULT_COLORS
-    
-    fig, ax = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI)
-    ax.set_facecolor('#F8F9FA')
-    fig.patch.set_facecolor('white')
-    
-    ax.plot(df['日期'], df['手表佩戴'], 
-            marker='o', markersize=8, color=colors['wear'], 
-            label='手表佩戴', linewidth=3, alpha=0.9)
-    ax.plot(df['日期'], df['手表未佩戴'], 
-            marker='s', markersize=8, color=colors['not_wear'], 
-            label='手表未佩戴', linewidth=3, alpha=0.9)
-    
-    ax.grid(True, linestyle='--', alpha=0.3, linewidth=1)
-    ax.set_axisbelow(True)
-    
-    ax.set_title(title, fontsize=TITLE_FONTSIZE, fontweight='bold', pad=20)
-    ax.set_xlabel('日期', fontsize=LABEL_FONTSIZE, fontweight='bold')
-    ax.set_ylabel('数量', fontsize=LABEL_FONTSIZE, fontweight='bold')
-    
-    ax.tick_params(axis='both', which='major', labelsize=TICK_FONTSIZE)
-    plt.xticks(rotation=45, ha='right')
-    
-    ax.legend(fontsize=LEGEND_FONTSIZE, frameon=True, shadow=True, 
-              fancybox=True, loc='best')
-    
-    plt.tight_layout()
-    return fig
+    return generate_chart('line_wear', df, title, colors)
 
 def generate_bar_chart(df, title, colors=None):
     """Chart 3: Daily Report Push Bar Chart"""
-    if colors is None:
-        colors = DEFAULT_COLORS
-    
-    fig, ax = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI)
-    ax.set_facecolor('#F8F9FA')
-    fig.patch.set_facecolor('white')
-    
-    x = range(len(df['日期']))
-    width = 0.35
-    
-    bars1 = ax.bar([i - width/2 for i in x], df['日报推送'], width, 
-                    label='日报推送', color=colors['push'], 
-                    edgecolor='white', linewidth=1.5, alpha=0.9)
-    bars2 = ax.bar([i + width/2 for i in x], df['日报未推送'], width, 
-                    label='日报未推送', color=colors['not_push'], 
-                    edgecolor='white', linewidth=1.5, alpha=0.9)
-    
-    ax.yaxis.grid(True, linestyle='--', alpha=0.3, linewidth=1)
-    ax.set_axisbelow(True)
-    
-    ax.set_title(title, fontsize=TITLE_FONTSIZE, fontweight='bold', pad=20)
-    ax.set_xlabel('日期', fontsize=LABEL_FONTSIZE, fontweight='bold')
-    ax.set_ylabel('数量', fontsize=LABEL_FONTSIZE, fontweight='bold')
-    
-    ax.set_xticks(x)
-    ax.set_xticklabels(df['日期'], rotation=45, ha='right')
-    ax.tick_params(axis='both', which='major', labelsize=TICK_FONTSIZE)
-    
-    ax.legend(fontsize=LEGEND_FONTSIZE, frameon=True, shadow=True, 
-              fancybox=True, loc='best')
-    
-    plt.tight_layout()
-    return fig
+    return generate_chart('bar_push', df, title, colors)
 
 def generate_pie_chart(df, title, colors=None):
     """Chart 4: Daily Report Push Pie Chart"""
+    return generate_chart('pie_push', df, title, colors)
+
+def generate_panels(df, titles, colors=None, kinds=None, ncols=2, panel_size=FIGURE_SIZE,
+                    title=None):
+    """
+    Layout engine: draws any number of registered charts (`kinds`, default
+    CHART_KINDS) as panels of one figure on an ncols-wide grid, so a
+    multi-panel report is laid out and rasterized in a single draw pass
+    instead of one figure per chart plus compositing. `title` adds a
+    figure-wide title above the grid.
+    """
+    kinds = list(kinds or CHART_KINDS)
+    if not kinds or len(titles) != len(kinds):
+        raise ValueError(f"需要 {len(kinds)} 个标题，实际为 {len(titles)} 个")
+    ncols = max(1, min(ncols, len(kinds)))
+    nrows = math.ceil(len(kinds) / ncols)
+    fig, axes = new_figure(figsize=(panel_size[0] * ncols, panel_size[1] * nrows),
+                           nrows=nrows, ncols=ncols, squeeze=False)
+    fig.patch.set_facecolor('white')
+    for ax, kind, title in zip(axes.flat, kinds, titles):
+        draw_chart(ax, CHART_SPECS[kind], df, title, colors)
+    for ax in axes.flat[len(kinds):]:
+        ax.set_visible(False)
+    top = 1.0
+    if title:
+        fig.suptitle(title, fontsize=SUPTITLE_FONTSIZE, fontweight='bold')
+        top = 1 - SUPTITLE_MARGIN / fig.get_size_inches()[1]
+    fig.tight_layout(pad=2.0, h_pad=3.0, w_pad=3.0, rect=(0, 0, 1, top))
+
+    # 面板之间的分隔线，按网格单元（而非饼图等定宽比坐标轴）定位
+    cells = [ax.get_subplotspec().get_position(fig) for ax in axes[0]]
+    for left, right in zip(cells, cells[1:]):
+        x = (left.x1 + right.x0) / 2
+        fig.add_artist(Line2D([x, x], [0.02, top - 0.02], color=SEPARATOR_COLOR, linewidth=1.5))
+    rows = [axes[row, 0].get_subplotspec().get_position(fig) for row in range(nrows)]
+    for upper, lower in zip(rows, rows[1:]):
+        y = (upper.y0 + lower.y1) / 2
+        fig.add_artist(Line2D([0.02, 0.98], [y, y], color=SEPARATOR_COLOR, linewidth=1.5))
+    return fig
+
+def generate_small_multiples(df, title, colors=None, metric='push', style='line'):
+    """
+    Small multiples: one line or bar panel per group (GROUP_COLUMN) in a
+    single figure, all panels sharing the date and count axes.
+    The per-group daily sums come from one groupby pass over the frame.
+    """
     if colors is None:
         colors = DEFAULT_COLORS
-    
-    fig, ax = plt.subplots(figsize=FIGURE_SIZE, dpi=DPI)
+    series = SMALL_MULTIPLE_SERIES[metric]
+    daily = group_daily(df)[[column for column, _ in series]]
+    if daily.empty:
+        raise ValueError("分组数据中没有可识别的日期")
+
+    dates = daily.index.get_level_values('date')
+    span_days = (dates.max() - dates.min()).days
+    if style == 'bar':
+        # 所有面板使用同一汇总粒度，日期跨度较长时按周/月汇总
+        rule, bin_days, _, unit = (('D', 1, None, '日') if span_days <= LARGE_SERIES_THRESHOLD
+                                   else _bin_rule(span_days))
+        daily = daily.groupby([pd.Grouper(level=0),
+                               pd.Grouper(level='date', freq=rule, label='left', closed='left')],
+                              observed=True).sum()
+
+    groups = daily.groupby(level=0, observed=True, sort=True)
+    ncols = min(GRID_MAX_COLUMNS, math.ceil(math.sqrt(groups.ngroups)))
+    nrows = math.ceil(groups.ngroups / ncols)
+    fig, axes = new_figure(figsize=(PANEL_SIZE[0] * ncols, PANEL_SIZE[1] * nrows + 1.2),
+                           nrows=nrows, ncols=ncols, sharex=True, sharey=True, squeeze=False)
     fig.patch.set_facecolor('white')
-    
-    total_push = df['日报推送'].sum()
-    total_not_push = df['日报未推送'].sum()
-    
-    sizes = [total_push, total_not_push]
-    labels = ['日报推送', '日报未推送']
-    pie_colors = [colors['push'], colors['not_push']]
-    explode = (0.05, 0.05)
-    
-    def func(pct, allvals):
-        absolute = int(round(pct/100.*sum(allvals)))
-        return "{:.1f}%\n({:d})".format(pct, absolute)
-    
-    wedges, texts, autotexts = ax.pie(sizes, explode=explode, labels=labels, 
-                                        colors=pie_colors, 
-                                        autopct=lambda pct: func(pct, sizes),
-                                        shadow=True, startangle=90,
-                                        textprops={'fontsize': TICK_FONTSIZE, 'fontweight': 'bold'})
-    
-    for autotext in autotexts:
-        autotext.set_color('white')
-        autotext.set_fontsize(LABEL_FONTSIZE)
-        autotext.set_fontweight('bold')
-    
-    for text in texts:
-        text.set_fontsize(LABEL_FONTSIZE)
-        text.set_fontweight('bold')
-    
-    ax.set_title(title, fontsize=TITLE_FONTSIZE, fontweight='bold', pad=20)
-    
-    plt.subplots_adjust(left=0.15, right=0.85, top=0.92, bottom=0.08)
-    
+
+    for ax, (group, frame) in zip(axes.flat, groups):
+        x = mdates.date2num(frame.index.get_level_values('date'))
+        for offset, (column, key) in zip((-0.5, 0.5), series):
+            y = frame[column].to_numpy()
+            if style == 'bar':
+                width = bin_days * 0.4
+                ax.bar(x + offset * width, y, width, color=colors[key], label=column, gid=key)
+            else:
+                keep = lttb_indices(x, y, PANEL_POINTS)
+                ax.plot(x[keep], y[keep], color=colors[key], label=column, linewidth=1.5, gid=key)
+        ax.set_facecolor(AXES_FACECOLOR)
+        ax.grid(True, **GRID_STYLE)
+        ax.set_axisbelow(True)
+        ax.set_title(str(group), fontsize=PANEL_TITLE_FONTSIZE, fontweight='bold')
+        ax.tick_params(axis='both', which='major', labelsize=TICK_FONTSIZE - 2)
+
+    # 共享坐标轴：日期刻度只计算一次并固定，避免每个面板重复运行定位器
+    first = axes.flat[0]
+    locator = mdates.AutoDateLocator(maxticks=5)
+    low, high = first.get_xlim()
+    first.xaxis.set_major_locator(FixedLocator(locator.tick_values(mdates.num2date(low),
+                                                                   mdates.num2date(high))))
+    first.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    first.yaxis.set_major_locator(MaxNLocator(nbins=4))
+    for index, ax in enumerate(axes.flat):
+        if index >= groups.ngroups:
+            ax.set_visible(False)
+            # 最后一行空缺时，由上一行面板显示日期刻度
+            if index >= ncols:
+                axes.flat[index - ncols].xaxis.set_tick_params(labelbottom=True)
+
+    handles, labels = first.get_legend_handles_labels()
+    fig.legend(handles, labels, loc='lower center', ncol=len(series), fontsize=LEGEND_FONTSIZE,
+               frameon=False)
+    if style == 'bar' and unit != '日':
+        title = f"{title}（按{unit}汇总）"
+    fig.suptitle(title, fontsize=TITLE_FONTSIZE, fontweight='bold')
+    # 面板尺寸一致，按英寸固定边距；多面板时 tight_layout 的开销随面板数成倍增长
+    width, height = fig.get_size_inches()
+    fig.subplots_adjust(left=0.6 / width, right=1 - 0.2 / width,
+                        top=1 - 0.8 / height, bottom=1.0 / height, wspace=0.12, hspace=0.35)
     return fig
+
+# 饼图阴影相对扇区颜色的加深程度（与 Axes.pie(shadow=True) 的默认值一致）
+PIE_SHADOW_SHADE = 0.7
+
+class Chart:
+    """
+    A rendered chart whose title and colors can be patched in place, so a
+    sidebar edit re-rasterizes the existing figure instead of re-plotting.
+    Artists that follow the color scheme carry their color key as gid.
+    """
+
+    def __init__(self, kind, fig):
+        self.kind = kind
+        self.fig = fig
+        self.ax = fig.axes[0]
+        # 饼图使用固定边距（subplots_adjust），其余图表使用 tight_layout
+        self.tight = CHART_SPECS[kind].style != 'pie'
+        self.title = self.ax.get_title()
+        self.colors = None
+        # 同一图表对象不能被多个会话线程同时修改和绘制
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, kind, df, title, colors=None):
+        chart = cls(kind, CHART_FUNCTIONS[kind](df, title, colors))
+        chart.colors = dict(colors or DEFAULT_COLORS)
+        return chart
+
+    def set_title(self, title):
+        """
+        Replaces the title text. Returns True if the title's rendered extent
+        changed, which means the layout has to be recomputed.
+        """
+        if title == self.title:
+            return False
+        renderer = self.fig.canvas.get_renderer()
+        before = self.ax.title.get_window_extent(renderer)
+        self.ax.title.set_text(title)
+        after = self.ax.title.get_window_extent(renderer)
+        self.title = title
+        return (before.width, before.height) != (after.width, after.height)
+
+    def set_colors(self, colors):
+        """
+        Recolors lines, bars, wedges (and their shadows) and legend handles.
+        """
+        colors = dict(colors or DEFAULT_COLORS)
+        if colors == self.colors:
+            return
+        labels = {}
+        for artist in self.ax.get_children():
+            key = artist.get_gid()
+            if key in colors:
+                if hasattr(artist, 'set_markerfacecolor'):
+                    artist.set_color(colors[key])
+                else:
+                    artist.set_facecolor(colors[key])
+                labels[artist.get_label()] = key
+            elif isinstance(artist, Shadow) and artist.patch.get_gid() in colors:
+                shade = (1 - PIE_SHADOW_SHADE) * np.asarray(to_rgb(colors[artist.patch.get_gid()]))
+                artist.set_facecolor(shade)
+                artist.set_edgecolor(shade)
+        # 柱状图的标签在 BarContainer 上
+        for container in self.ax.containers:
+            if container.patches and container.patches[0].get_gid() in colors:
+                labels[container.get_label()] = container.patches[0].get_gid()
+
+        legend = self.ax.get_legend()
+        if legend is not None:
+            for handle, text in zip(legend.legend_handles, legend.get_texts()):
+                key = labels.get(text.get_text())
+                if key is None:
+                    continue
+                if hasattr(handle, 'set_markerfacecolor'):
+                    handle.set_color(colors[key])
+                else:
+                    handle.set_facecolor(colors[key])
+        self.colors = colors
+
+    def update(self, title=None, colors=None):
+        """
+        Applies a new title and/or colors, re-running the layout only when
+        the title's extent changed.
+        """
+        relayout = title is not None and self.set_title(title)
+        if colors is not None:
+            self.set_colors(colors)
+        if relayout and self.tight:
+            # tight_layout 以当前边距为起点迭代；先恢复新建图表的默认边距，结果才与重新生成一致
+            self.fig.subplots_adjust(**{name: matplotlib.rcParams[f'figure.subplot.{name}']
+                                        for name in ('left', 'right', 'top', 'bottom',
+                                                     'wspace', 'hspace')})
+            self.fig.tight_layout()
+
+    @property
+    def closed(self):
+        return self.fig is None
+
+    def close(self):
+        with self.lock:
+            if self.fig is not None:
+                self.fig.clear()
+                self.fig = None
+
+# 图表类型 -> 生成函数（由注册表派生）
+CHART_FUNCTIONS = {kind: partial(generate_chart, kind) for kind in CHART_SPECS}
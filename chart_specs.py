@@ -0,0 +1,46 @@
+"""
+Registry of the report charts.
+
+Each ChartSpec names a chart kind, its drawing style, the series it plots
+and its default title. The registry drives the matplotlib charts
+(chart_generator), the browser charts (web_charts), the panel layout and
+the app's title settings, so adding a chart costs one entry here plus a
+drawer for a new style. The module has no heavy imports so the app can read
+it before the plotting stack is loaded.
+"""
+
+
+class ChartSpec:
+    """
+    Declarative description of one report chart: its drawing style
+    ('line', 'bar' or 'pie'), the (column, color key, marker) series it
+    plots and its default title.
+    """
+
+    def __init__(self, kind, style, series, title):
+        self.kind = kind
+        self.style = style
+        self.series = series
+        self.title = title
+
+    @property
+    def columns(self):
+        return [column for column, _, _ in self.series]
+
+
+# 图表注册表，顺序即整合截图中的位置；新增图表只需添加一项
+CHART_SPECS = {spec.kind: spec for spec in [
+    ChartSpec('line_push', 'line', [('日报推送', 'push', 'o'), ('日报未推送', 'not_push', 's')],
+              "日报推送折线图"),
+    ChartSpec('line_wear', 'line', [('手表佩戴', 'wear', 'o'), ('手表未佩戴', 'not_wear', 's')],
+              "佩戴趋势折线图"),
+    ChartSpec('bar_push', 'bar', [('日报推送', 'push', None), ('日报未推送', 'not_push', None)],
+              "日报推送柱状图"),
+    ChartSpec('pie_push', 'pie', [('日报推送', 'push', None), ('日报未推送', 'not_push', None)],
+              "推送占比饼图"),
+]}
+CHART_KINDS = list(CHART_SPECS)
+
+# 默认标题：总标题及各图表的标题
+DEFAULT_TITLE_ALL = "12 月运营日报图表"
+DEFAULT_TITLES = [spec.title for spec in CHART_SPECS.values()]
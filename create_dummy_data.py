@@ -1,18 +1,85 @@
+"""
+Synthetic workbook generator for demos and benchmarks.
+
+Usage: python create_dummy_data.py [--rows 10] [--extra-columns 0] [--groups 0]
+                                   [--variant 手表|腕表] [--missing-rate 0] [-o test_data.xlsx]
+"""
+import argparse
+import os
+
 import pandas as pd
 import numpy as np
 
-# Create dummy data
-dates = pd.date_range(start='2023-12-01', periods=10, freq='D')
-data = {
-    '日期': dates,
-    '日报推送': np.random.randint(50, 100, size=10),
-    '日报未推送': np.random.randint(0, 20, size=10),
-    '手表佩戴': np.random.randint(40, 90, size=10),
-    '手表未佩戴': np.random.randint(10, 30, size=10)
-}
-
-df = pd.DataFrame(data)
-
-# Save to Excel
-df.to_excel('e:/表格/test_data.xlsx', index=False)
-print("Dummy data created: e:/表格/test_data.xlsx")
+HEADER_VARIANTS = ['手表', '腕表']
+
+
+def make_frame(rows=10, extra_columns=0, variant='手表', missing_rate=0.0,
+               seed=0, start='2023-12-01', groups=0):
+    """
+    Builds a raw upload-shaped frame: the five required columns (watch
+    columns named with `variant`), `extra_columns` junk columns, and roughly
+    `missing_rate` of the metric cells left empty. With `groups`, every day
+    has one row per department ('部门' column).
+    """
+    rng = np.random.default_rng(seed)
+    if groups:
+        days = pd.date_range(start=start, periods=-(-rows // groups), freq='D')
+        dates = np.repeat(days, groups)[:rows]
+    else:
+        dates = pd.date_range(start=start, periods=rows, freq='D')
+    data = {
+        '日期': dates,
+        '日报推送': rng.integers(50, 100, size=rows),
+        '日报未推送': rng.integers(0, 20, size=rows),
+        f'{variant}佩戴': rng.integers(40, 90, size=rows),
+        f'{variant}未佩戴': rng.integers(10, 30, size=rows),
+    }
+    metrics = list(data)[1:]
+    df = pd.DataFrame(data)
+    if groups:
+        df.insert(1, '部门', np.tile([f'部门{i + 1:02d}' for i in range(groups)], len(days))[:rows])
+
+    # 随机置空部分指标单元格（按列名，不包括日期和部门列）
+    if missing_rate > 0:
+        for col in metrics:
+            mask = rng.random(rows) < missing_rate
+            df[col] = df[col].astype('float64').mask(mask)
+
+    # 真实导出中常见的无关列
+    for i in range(extra_columns):
+        df[f'备注{i + 1}'] = rng.integers(0, 1000, size=rows) if i % 2 else f'附加信息{i + 1}'
+    return df
+
+
+def write_frame(df, path):
+    """
+    Writes a frame as .xlsx, .csv or .parquet depending on the extension.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        df.to_csv(path, index=False)
+    elif ext == '.parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a synthetic daily report workbook")
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--extra-columns', type=int, default=0)
+    parser.add_argument('--variant', choices=HEADER_VARIANTS, default='手表')
+    parser.add_argument('--missing-rate', type=float, default=0.0)
+    parser.add_argument('--groups', type=int, default=0, help="number of departments")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='test_data.xlsx')
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.extra_columns, args.variant, args.missing_rate, args.seed,
+                    groups=args.groups)
+    write_frame(df, args.output)
+    print(f"Dummy data created: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,564 @@
 import pandas as pd
+import numpy as np
+import csv
+import hashlib
 import io
+import json
+import os
+import re
+from contextlib import closing
+from datetime import datetime
+
+# 修改解析/预处理逻辑后递增，使磁盘缓存中的旧结果失效
+PROCESSOR_VERSION = 6
 
 REQUIRED_COLUMNS = ['日期', '日报推送', '日报未推送', '手表佩戴', '手表未佩戴']
+NUMERIC_COLUMNS = ['日报推送', '日报未推送', '手表佩戴', '手表未佩戴']
+
+# 可选的分组列（部门/团队），存在时按组生成小图
+GROUP_COLUMN = '部门'
+GROUP_ALIASES = ('团队', '小组', '组别')
+# 分组列为空的行归入该组
+UNGROUPED_LABEL = '未分组'
+OPTIONAL_COLUMNS = [GROUP_COLUMN]
+
+# 指标列的目标类型：计数值用 int32 存储，内存只有 float64 的一半
+METRIC_SCHEMA = {col: 'int32' for col in NUMERIC_COLUMNS}
+
+# 日期列按顺序尝试的格式，只用样本探测一次，再整列矢量化解析
+DATE_FORMATS = [
+    '%Y-%m-%d', '%Y.%m.%d', '%Y/%m/%d', '%Y%m%d',
+    '%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M:%S',
+    '%Y年%m月%d日', '%m月%d日', '%m-%d', '%m/%d', '%m.%d',
+]
+DATE_SAMPLE_SIZE = 20
+# 不含年份的日期：相邻两行月份回退超过该值视为跨年（如 12 月 -> 1 月）
+YEAR_ROLLOVER_MONTHS = 6
+
+# '%m-%d' 显示标签查找表，按 month * 32 + day 索引，避免逐元素 strftime
+_DATE_LABELS = np.array([f"{m:02d}-{d:02d}" for m in range(13) for d in range(32)], dtype=object)
+
+# 按扩展名识别输入格式
+FORMAT_EXTENSIONS = {
+    '.xlsx': 'xlsx', '.xlsm': 'xlsx',
+    '.xls': 'xls',
+    '.csv': 'csv', '.txt': 'csv',
+    '.parquet': 'parquet', '.pq': 'parquet',
+}
+
+# 表头别名：规范列名 -> 其他写法。比较时忽略首尾空白和大小写，空格/下划线/连字符视为相同，
+# "腕表" 视同 "手表"。设置 CHART_COLUMN_ALIASES 为同格式的 JSON 文件路径可追加别名。
+# 只收录不会与导出表中其他列混淆的写法；"时间"、"推送" 这类泛称如需使用请在 JSON 中显式添加
+DEFAULT_COLUMN_ALIASES = {
+    '日期': ['date', '统计日期'],
+    '日报推送': ['推送数', '已推送', 'pushed'],
+    '日报未推送': ['未推送数', 'not push', 'unpushed'],
+    '手表佩戴': ['佩戴数', '已佩戴', 'worn'],
+    '手表未佩戴': ['未佩戴数', 'not wear', 'unworn'],
+    GROUP_COLUMN: list(GROUP_ALIASES) + ['department', 'dept', 'team', 'group'],
+}
+# 表头探测时每个工作表检查的行数（允许表头上方有标题行）
+HEADER_SCAN_ROWS = 5
+# CSV 表头探测读取的字节数
+HEADER_SCAN_BYTES = 64 * 1024
+CSV_ENCODINGS = ('utf-8-sig', 'gbk')
+
+def _header_key(name):
+    # 统一空白、分隔符和大小写后用于比较
+    return re.sub(r'[\s_\-]+', ' ', str(name)).strip().casefold().replace('腕表', '手表')
+
+def load_aliases(path=None):
+    """
+    Returns DEFAULT_COLUMN_ALIASES extended with the aliases of a JSON file
+    ({"规范列名": ["别名", ...]}), by default the one named by
+    CHART_COLUMN_ALIASES.
+    """
+    aliases = {column: list(names) for column, names in DEFAULT_COLUMN_ALIASES.items()}
+    path = path or os.environ.get('CHART_COLUMN_ALIASES')
+    if path:
+        with open(path, encoding='utf-8') as f:
+            for column, names in json.load(f).items():
+                aliases.setdefault(column, []).extend(names)
+    return aliases
+
+def alias_lookup(aliases):
+    """
+    Turns a {canonical: [aliases]} table into a header key -> canonical map.
+    """
+    lookup = {}
+    for column, names in aliases.items():
+        for name in [column, *names]:
+            lookup.setdefault(_header_key(name), column)
+    return lookup
+
+COLUMN_ALIASES = load_aliases()
+_ALIAS_LOOKUP = alias_lookup(COLUMN_ALIASES)
+# 别名表的指纹：别名变化后磁盘缓存中按旧映射解析的结果失效
+ALIASES_KEY = hashlib.sha256(json.dumps(COLUMN_ALIASES, sort_keys=True,
+                                        ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+
+def normalize_header(name, lookup=None):
+    """
+    Maps a raw header cell to its canonical column name through the alias
+    table (unknown headers are only stripped).
+    """
+    return (lookup or _ALIAS_LOOKUP).get(_header_key(name), str(name).strip())
+
+def header_error(missing, sheet=None):
+    where = f"（工作表「{sheet}」）" if sheet else ""
+    return ValueError(f"表头格式不正确{where}，请确认包含：日期、日报推送、日报未推送、手表佩戴（或腕表佩戴）、手表未佩戴（或腕表未佩戴）五列。缺失: {', '.join(missing)}")
+
+def detect_format(file):
+    """
+    Detects the input format from the file name, falling back to magic bytes.
+    """
+    name = file if isinstance(file, (str, os.PathLike)) else getattr(file, 'name', '')
+    fmt = FORMAT_EXTENSIONS.get(os.path.splitext(str(name))[1].lower())
+    if fmt:
+        return fmt
+
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            head = f.read(8)
+    else:
+        pos = file.tell()
+        head = file.read(8)
+        file.seek(pos)
+
+    if head.startswith(b'PK'):
+        return 'xlsx'
+    if head.startswith(b'PAR1'):
+        return 'parquet'
+    if head.startswith(b'\xd0\xcf\x11\xe0'):
+        return 'xls'
+    return 'csv'
+
+def _has_calamine():
+    try:
+        import python_calamine  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _to_column(values, name):
+    # 数值列优先使用 float64 数组，含文本时保留 object 交给 preprocess_data 处理
+    if normalize_header(name) in NUMERIC_COLUMNS:
+        try:
+            return np.array([np.nan if v is None else v for v in values], dtype='float64')
+        except (TypeError, ValueError):
+            pass
+    return pd.Series(values, dtype=None if values else 'object')
+
+def _stream_xlsx(file, probe):
+    """
+    Streams the probed sheet in openpyxl read-only mode, keeping only the
+    cells of the columns the HeaderProbe resolved, named canonically.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0] if probe.sheet is None else workbook[probe.sheet]
+        rows = worksheet.iter_rows(values_only=True)
+        # 跳过表头及其上方的标题行
+        for _ in range(probe.header_row + 1):
+            next(rows, None)
+        projection = dict(sorted(probe.columns.items()))
+
+        data = {name: [] for name in projection.values()}
+        row_count = 0
+        last_filled = 0
+        for row in rows:
+            row_count += 1
+            filled = False
+            for index, name in projection.items():
+                value = row[index] if index < len(row) else None
+                data[name].append(value)
+                filled = filled or value is not None
+            if filled:
+                last_filled = row_count
+    finally:
+        workbook.close()
+
+    # 去掉 read-only 模式下尾部仅有格式的空行
+    return pd.DataFrame({name: _to_column(values[:last_filled], name)
+                         for name, values in data.items()})
+
+class HeaderProbe:
+    """
+    Where a file's header is and how its cells map to canonical columns, as
+    found by probe_headers(); load_data(probe=...) then reads only those
+    columns.
+    """
+
+    def __init__(self, fmt, sheet, header_row, headers, columns, encoding=None):
+        self.fmt = fmt
+        self.sheet = sheet              # 工作表名，CSV/Parquet 为 None
+        self.header_row = header_row    # 表头所在行号（从 0 开始）
+        self.headers = headers          # 表头行的原始单元格
+        self.columns = columns          # 列位置 -> 规范列名
+        self.encoding = encoding        # CSV 文本编码
+
+def _header_rows(file, fmt, sheet):
+    """
+    Yields (sheet name, first rows, encoding) per candidate sheet without
+    reading the data below the header.
+    """
+    if fmt == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            worksheets = workbook.worksheets if sheet is None else [workbook[sheet]]
+            for worksheet in worksheets:
+                yield worksheet.title, list(worksheet.iter_rows(max_row=HEADER_SCAN_ROWS,
+                                                                values_only=True)), None
+        finally:
+            workbook.close()
+    elif fmt == 'xls':
+        frames = pd.read_excel(file, sheet_name=sheet, header=None, nrows=HEADER_SCAN_ROWS)
+        if sheet is not None:
+            frames = {sheet: frames}
+        for name, frame in frames.items():
+            yield name, frame.values.tolist(), None
+    elif fmt == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+            names = pq.ParquetFile(file).schema_arrow.names
+        except ImportError:
+            names = list(pd.read_parquet(file).columns)
+        yield None, [names], None
+    else:
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, 'rb') as f:
+                head = f.read(HEADER_SCAN_BYTES)
+        else:
+            head = file.read(HEADER_SCAN_BYTES)
+        # 截断到最后一个完整行，避免切断多字节字符
+        if len(head) == HEADER_SCAN_BYTES and b'\n' in head:
+            head = head[:head.rindex(b'\n') + 1]
+        for encoding in CSV_ENCODINGS:
+            try:
+                text = head.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+            lines = text.splitlines()[:HEADER_SCAN_ROWS]
+            yield None, list(csv.reader(lines)), encoding
+            return
+        raise ValueError("无法识别 CSV 文件编码")
+
+def _match_header(cells, lookup, columns):
+    """
+    Maps a header row to {position: canonical column}. A cell spelling the
+    canonical name wins over alias matches; two cells matching the same
+    column equally well raise a ValueError instead of picking one.
+    """
+    # 规范列名 -> {优先级: [列位置]}，0 为规范列名本身，1 为别名
+    matches = {}
+    for index, cell in enumerate(cells):
+        if cell is None or (not isinstance(cell, str) and pd.isna(cell)):
+            continue
+        key = _header_key(cell)
+        column = lookup.get(key)
+        if column in columns:
+            rank = 0 if key == _header_key(column) else 1
+            matches.setdefault(column, {}).setdefault(rank, []).append(index)
+
+    mapping = {}
+    for column, ranked in matches.items():
+        positions = ranked[min(ranked)]
+        if len(positions) > 1:
+            names = "、".join(str(cells[i]).strip() for i in positions)
+            raise ValueError(f"表头有歧义：{names} 都对应「{column}」列，请删除或重命名多余的列")
+        mapping[positions[0]] = column
+    return mapping
 
-def load_data(file):
+def probe_headers(file, sheet=None, columns=None, aliases=None):
     """
-    Loads data from an uploaded Excel file.
+    Reads only the first HEADER_SCAN_ROWS rows of each sheet (or of `sheet`)
+    and returns a HeaderProbe for the first sheet and row whose headers,
+    resolved through the alias table, contain every REQUIRED_COLUMNS entry.
+    Raises the header ValueError without parsing the data when none does.
     """
+    if columns is None:
+        columns = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+    lookup = _ALIAS_LOOKUP if aliases is None else alias_lookup(aliases)
+    fmt = detect_format(file)
+    best = None
     try:
-        df = pd.read_excel(file)
-        return df
+        with closing(_header_rows(file, fmt, sheet)) as candidates:
+            for sheet_name, rows, encoding in candidates:
+                for row_index, cells in enumerate(rows):
+                    mapping = _match_header(cells, lookup, columns)
+                    missing = [col for col in REQUIRED_COLUMNS if col not in mapping.values()]
+                    if not missing:
+                        return HeaderProbe(fmt, sheet_name, row_index, list(cells), mapping, encoding)
+                    if best is None or len(missing) < len(best[1]):
+                        best = (sheet_name, missing)
+    except ValueError:
+        raise
     except Exception as e:
-        raise ValueError(f"Error reading Excel file: {e}")
+        raise ValueError(f"Error reading file: {e}")
+    finally:
+        if not isinstance(file, (str, os.PathLike)):
+            file.seek(0)
+    # 没有匹配的工作表时，报告最接近的一个缺少哪些列
+    sheet_name, missing = best or (sheet, list(REQUIRED_COLUMNS))
+    raise header_error(missing, sheet_name)
+
+def _read_probed(file, probe, engine=None):
+    """
+    Bulk-reads only the columns resolved by a HeaderProbe and names them
+    canonically.
+    """
+    positions = sorted(probe.columns)
+    if probe.fmt == 'csv':
+        df = pd.read_csv(file, skiprows=probe.header_row, usecols=positions, encoding=probe.encoding)
+    elif probe.fmt == 'parquet':
+        df = pd.read_parquet(file, columns=[probe.headers[i] for i in positions])
+    elif probe.fmt == 'xls' or engine == 'calamine' or (engine is None and _has_calamine()):
+        df = pd.read_excel(file, sheet_name=probe.sheet, header=probe.header_row, usecols=positions,
+                           engine='calamine' if probe.fmt == 'xlsx' else None)
+    else:
+        return _stream_xlsx(file, probe)
+    df.columns = [probe.columns[i] for i in positions]
+    return df
+
+def load_data(file, columns=None, projected=True, engine=None, sheet=None, probe=None):
+    """
+    Loads data from an uploaded Excel, CSV or Parquet file.
+    With a HeaderProbe from probe_headers() only its resolved columns are
+    read from its sheet and header row, already under canonical names.
+    With projected=True (and no probe) the headers are probed first, so only
+    the columns in `columns` (default REQUIRED_COLUMNS plus OPTIONAL_COLUMNS)
+    are read and memory scales with the needed columns rather than the whole
+    workbook. Excel files are streamed in openpyxl read-only mode, or parsed
+    with calamine when it is installed.
+    `sheet` selects an Excel sheet by name (default: the first matching sheet).
+    """
+    if not projected:
+        try:
+            return pd.read_excel(file, sheet_name=0 if sheet is None else sheet)
+        except Exception as e:
+            raise ValueError(f"Error reading file: {e}")
+    if probe is None:
+        probe = probe_headers(file, sheet, columns)
+    try:
+        return _read_probed(file, probe, engine)
+    except Exception as e:
+        raise ValueError(f"Error reading file: {e}")
+
+def list_sheets(file):
+    """
+    Returns the sheet names of an Excel workbook ([None] for CSV/Parquet).
+    """
+    fmt = detect_format(file)
+    if fmt == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(file, read_only=True)
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+    if fmt == 'xls':
+        return list(pd.ExcelFile(file).sheet_names)
+    return [None]
 
 def validate_columns(df):
     """
     Validates that the dataframe contains the required columns.
-    Supports both '手表' and '腕表' naming conventions.
+    Header cells are mapped through the alias table (see normalize_header),
+    which also covers the '腕表' naming; only the resolved columns are kept,
+    under their canonical names.
     """
-    # Normalize column names: replace '腕表' with '手表'
-    df.columns = df.columns.str.replace('腕表', '手表')
-    
-    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    # Resolve column names through the alias table; exact names win over aliases
+    mapping = _match_header(list(df.columns), _ALIAS_LOOKUP, REQUIRED_COLUMNS + OPTIONAL_COLUMNS)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in mapping.values()]
     if missing_columns:
-        raise ValueError(f"表头格式不正确，请确认包含：日期、日报推送、日报未推送、手表佩戴（或腕表佩戴）、手表未佩戴（或腕表未佩戴）五列。缺失: {', '.join(missing_columns)}")
+        raise header_error(missing_columns)
+    positions = sorted(mapping)
+    if len(positions) != len(df.columns):
+        df = df.iloc[:, positions]
+    df.columns = [mapping[i] for i in positions]
     return df
 
-def preprocess_data(df):
-    """
-    Preprocesses the data:
-    - Fills missing values with 0.
-    - Ensures '日期' is in datetime format (optional, but good for sorting).
-    - Converts numeric columns to numeric types.
-    """
-    # Fill missing values with 0
-    df = df.fillna(0)
-    
-    # Ensure numeric columns are numeric
-    numeric_cols = ['日报推送', '日报未推送', '手表佩戴', '手表未佩戴']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-    # Convert Date to string for display if it's datetime
-    if pd.api.types.is_datetime64_any_dtype(df['日期']):
-         df['日期'] = df['日期'].dt.strftime('%m-%d')
-    else:
-        # If it's string, leave it, or try to parse
-        try:
-            df['日期'] = pd.to_datetime(df['日期']).dt.strftime('%m-%d')
-        except:
-            pass # Keep as is if parsing fails
+def detect_date_format(values):
+    """
+    Returns the first DATE_FORMATS entry that parses every sampled value,
+    else the one parsing the most samples, or None if none parses any.
+    """
+    sample = values.dropna().head(DATE_SAMPLE_SIZE)
+    best_fmt, best_count = None, 0
+    for fmt in DATE_FORMATS:
+        count = 0
+        for value in sample:
+            try:
+                datetime.strptime(value, fmt)
+                count += 1
+            except ValueError:
+                pass
+        if count == len(sample):
+            return fmt
+        if count > best_count:
+            best_fmt, best_count = fmt, count
+    return best_fmt
 
-    return df
+def infer_years(parsed, reference=None):
+    """
+    Assigns years to dates parsed without one (month and day are kept).
+    Rows are taken in file order: a month jump of more than
+    YEAR_ROLLOVER_MONTHS backwards starts the next year (forwards, the
+    previous one), and the latest date is placed in the year that keeps it
+    on or before `reference` (default: today).
+    """
+    reference = pd.Timestamp.today().normalize() if reference is None else pd.Timestamp(reference)
+    valid = parsed.notna().to_numpy()
+    if not valid.any():
+        return parsed
+    months = parsed.dt.month.to_numpy()[valid].astype('int64')
+    days = parsed.dt.day.to_numpy()[valid].astype('int64')
+    step = np.diff(months, prepend=months[0])
+    offset = np.cumsum(step < -YEAR_ROLLOVER_MONTHS) - np.cumsum(step > YEAR_ROLLOVER_MONTHS)
+
+    def build(year):
+        # 2 月 29 日落在平年时为 NaT，计入无法识别的日期
+        return pd.to_datetime(pd.DataFrame({'year': year + offset, 'month': months, 'day': days}),
+                              errors='coerce')
+
+    year = reference.year - offset.max()
+    dates = build(year)
+    if dates.max() > reference:
+        dates = build(year - 1)
+    values = np.full(len(parsed), np.datetime64('NaT'), dtype='datetime64[ns]')
+    values[valid] = dates.to_numpy(dtype='datetime64[ns]')
+    return pd.Series(values, index=parsed.index, name=parsed.name)
+
+def _parse_dates(dates, reference=None):
+    # 返回 (解析后的 datetime 列, 清理后的原始文本)
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates, dates.astype('string')
+    text = dates.astype('string').str.strip()
+    fmt = detect_date_format(text)
+    if fmt is not None and '%Y' not in fmt:
+        # 不含年份的格式先按闰年解析（保留 2 月 29 日），再推断实际年份，不产生 1900 年的日期
+        parsed = pd.to_datetime('2000-' + text, format='%Y-' + fmt, errors='coerce')
+        return infer_years(parsed, reference), text
+    if fmt is not None:
+        return pd.to_datetime(text, format=fmt, errors='coerce'), text
+    return pd.to_datetime(text, format='mixed', errors='coerce'), text
+
+def preprocess_data(df, reference=None):
+    """
+    Preprocesses the data according to METRIC_SCHEMA:
+    - Converts the metric columns to compact integer dtypes in one pass,
+      treating missing or non-numeric cells as 0.
+    - Parses '日期' with a format detected once from a sample; the result is
+      kept as the frame's DatetimeIndex and '日期' holds the '%m-%d' label.
+      Dates written without a year get one from infer_years (relative to
+      `reference`, default today).
+    - Keeps the optional GROUP_COLUMN as a categorical column, with empty
+      cells labelled UNGROUPED_LABEL.
+    - Records per-column counts of missing and coerced cells in
+      df.attrs['missing'] / df.attrs['coercions'].
+    """
+    metrics = df[NUMERIC_COLUMNS]
+    missing = metrics.isna()
+    numeric = metrics.apply(pd.to_numeric, errors='coerce')
+    # 原本有值但无法转换为数字的单元格
+    coerced = numeric.isna() & ~missing
+    numeric = numeric.fillna(0).round().astype(METRIC_SCHEMA)
+
+    parsed, text = _parse_dates(df['日期'], reference)
+    # 无法解析的日期保留原始文本作为显示标签
+    valid = parsed.notna().to_numpy()
+    codes = np.where(valid, parsed.dt.month.fillna(0) * 32 + parsed.dt.day.fillna(0), 0).astype('int64')
+    labels = pd.Series(_DATE_LABELS[codes], index=df.index, dtype='string')
+    labels = labels.where(valid, text).fillna('')
+    unparsed = int((parsed.isna() & text.notna()).sum())
+
+    result = pd.concat([labels.rename('日期'), numeric], axis=1)
+    if GROUP_COLUMN in df.columns:
+        groups = df[GROUP_COLUMN].astype('string').str.strip().replace('', pd.NA)
+        result[GROUP_COLUMN] = groups.fillna(UNGROUPED_LABEL).astype('category')
+    result.index = pd.DatetimeIndex(parsed, name='date')
+
+    result.attrs['missing'] = {col: int(n) for col, n in missing.sum().items() if n}
+    result.attrs['coercions'] = {col: int(n) for col, n in coerced.sum().items() if n}
+    if unparsed:
+        result.attrs['coercions']['日期'] = unparsed
+    return result
 
 def calculate_stats(df):
     """
-    Calculates statistics for the summary.
-    Returns a dictionary with stats.
-    """
-    total_push = df['日报推送'].sum()
-    total_not_push = df['日报未推送'].sum()
-    total_days_push = total_push + total_not_push
-    push_rate = (total_push / total_days_push * 100) if total_days_push > 0 else 0
-
-    total_wear = df['手表佩戴'].sum()
-    total_not_wear = df['手表未佩戴'].sum()
-    total_days_wear = total_wear + total_not_wear
-    wear_rate = (total_wear / total_days_wear * 100) if total_days_wear > 0 else 0
-    
-    # Trend analysis (simple: compare last 7 days vs previous 7 days if possible, or just slope)
-    # For now, just return the rates.
-    
-    return {
-        'push_rate': push_rate,
-        'wear_rate': wear_rate
-    }
+    Calculates statistics for the summary from the shared analytics
+    aggregates (see analytics.aggregate).
+    Returns a dictionary with stats; per metric ('push', 'wear'):
+    - overall rate, rate of the last 7 days and of the 7 days before,
+      and their week-over-week difference in percentage points
+    - lowest / highest day and anomalous days ('%Y-%m-%d')
+    Period values are None when the data has no dated rows for them.
+    """
+    from analytics import METRICS, aggregate
+
+    agg = aggregate(df)
+    stats = {'days': len(agg)}
+    for metric in METRICS:
+        last_week = agg.period_rate(metric, 7)
+        prev_week = agg.period_rate(metric, 7, offset=7)
+        stats[f'{metric}_rate'] = agg.rate(metric)
+        stats[f'{metric}_rate_7d'] = last_week
+        stats[f'{metric}_rate_prev_7d'] = prev_week
+        stats[f'{metric}_wow'] = None if last_week is None or prev_week is None else last_week - prev_week
+
+        extremes = agg.extremes(metric)
+        for key, extreme in zip(('min', 'max'), extremes or (None, None)):
+            stats[f'{metric}_{key}_day'] = extreme and {'date': extreme[0].strftime('%Y-%m-%d'),
+                                                        'rate': extreme[1]}
+        stats[f'{metric}_anomalies'] = [d.strftime('%Y-%m-%d') for d in agg.anomalies(metric)]
+    return stats
+
+# 汇总粒度 -> 说明；周为 ISO 周（周一至周日），以周一日期标记
+GRANULARITIES = {'day': '按日', 'week': '按周', 'month': '按月'}
+_ROLLUP_PERIODS = {'week': 'W-SUN', 'month': 'M'}
+# 派生比率列（百分比）-> (完成列, 未完成列)
+RATE_COLUMNS = {'push_rate': ('日报推送', '日报未推送'), 'wear_rate': ('手表佩戴', '手表未佩戴')}
+
+def _rollup_frame(counts, fmt):
+    frame = counts.copy()
+    frame.index.name = 'date'
+    frame.insert(0, '日期', pd.array(frame.index.strftime(fmt), dtype='string'))
+    for column, (done, missed) in RATE_COLUMNS.items():
+        total = frame[done] + frame[missed]
+        # 分母为 0 的周期比率为 NaN
+        frame[column] = frame[done] / total.where(total > 0) * 100
+    return frame
+
+def build_rollups(df):
+    """
+    Builds the rollup cube of a preprocessed frame: daily, ISO-week and
+    monthly sums of the metric columns plus push/wear rates in percent
+    (RATE_COLUMNS). The rows are folded once into the shared daily
+    aggregates; weeks and months are sums of those days. The daily level
+    also carries the derived series of analytics.Aggregates.to_frame()
+    (rolling 7/30-day rates, week-over-week change, z-scores).
+    Returns {granularity: frame} for GRANULARITIES. Each frame is shaped like
+    preprocess_data output (DatetimeIndex at the period start, '日期' label,
+    metric columns), so it can be charted directly. Rows without a parsed
+    date are left out, and groups are summed.
+    """
+    from analytics import aggregate
+
+    agg = aggregate(df)
+    daily = pd.DataFrame(agg.counts, index=agg.dates, columns=NUMERIC_COLUMNS)
+    derived = agg.to_frame().drop(columns=list(RATE_COLUMNS))
+    cube = {'day': _rollup_frame(daily, '%m-%d').join(derived)}
+    for level, freq in _ROLLUP_PERIODS.items():
+        summed = daily.groupby(daily.index.to_period(freq)).sum()
+        summed.index = summed.index.start_time
+        if level == 'month':
+            fmt = '%Y-%m'
+        elif len(summed) and summed.index[0].year != summed.index[-1].year:
+            fmt = '%Y-%m-%d'
+        else:
+            fmt = '%m-%d'
+        cube[level] = _rollup_frame(summed, fmt)
+    return cube
@@ -0,0 +1,154 @@
+"""
+One-time CJK font configuration for matplotlib.
+
+The chosen font (path, family name, resulting rcParams) is resolved once and
+persisted next to matplotlib's own font cache, so later process starts only
+read a small JSON file instead of wiping and rebuilding the font list. Only
+a found font file is persisted: without one the candidates are probed again
+on every start, so a font installed later is picked up.
+"""
+import json
+import os
+import platform
+import threading
+import time
+
+# 各平台按优先级探测的中文字体文件
+FONT_CANDIDATES = {
+    'Linux': [
+        '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+        '/usr/share/fonts/truetype/wqy-microhei/wqy-microhei.ttc',
+        '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
+        '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+        '/usr/share/fonts/truetype/noto-cjk/NotoSansCJK-Regular.ttc',
+    ],
+    'Windows': [
+        r'C:\Windows\Fonts\msyh.ttc',
+        r'C:\Windows\Fonts\simhei.ttf',
+    ],
+}
+
+# 找不到字体文件时按名称回退
+FALLBACK_FONT_NAMES = {
+    'Linux': ['WenQuanYi Micro Hei', 'WenQuanYi Zen Hei', 'Noto Sans CJK SC', 'DejaVu Sans'],
+    'Darwin': ['Arial Unicode MS', 'PingFang SC'],
+}
+
+CACHE_FILENAME = 'cjk_font.json'
+# 修改探测逻辑后递增，使旧的缓存结果失效
+CACHE_VERSION = 1
+
+_lock = threading.Lock()
+_configured = None
+
+
+def cache_path():
+    import matplotlib
+    return os.path.join(matplotlib.get_cachedir(), CACHE_FILENAME)
+
+
+def resolve_font():
+    """
+    Probes the platform's candidate font files and returns the font config:
+    {'path': ..., 'name': ..., 'sans_serif': [...]}.
+    """
+    from matplotlib import font_manager as fm
+
+    system = platform.system()
+    for font_path in FONT_CANDIDATES.get(system, []):
+        if not os.path.exists(font_path):
+            continue
+        try:
+            font_name = fm.FontProperties(fname=font_path).get_name()
+        except Exception as e:
+            print(f"Failed to read {font_path}: {e}")
+            continue
+        return {'path': font_path, 'name': font_name, 'sans_serif': [font_name]}
+
+    names = FALLBACK_FONT_NAMES.get(system, [])
+    return {'path': None, 'name': names[0] if names else None, 'sans_serif': names}
+
+
+def _cache_key():
+    import matplotlib
+    return {'version': CACHE_VERSION, 'system': platform.system(),
+            'matplotlib': matplotlib.__version__}
+
+
+def load_cached():
+    """
+    Returns the persisted font config, or None if missing, stale or
+    without a font file.
+    """
+    try:
+        with open(cache_path(), encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('key') != _cache_key():
+        return None
+    config = cached.get('font') or {}
+    # 只有按名称回退的结果不复用：之后安装的字体文件要能被探测到
+    if not config.get('path') or not os.path.exists(config['path']):
+        return None
+    return config
+
+
+def save_cached(config):
+    path = cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'key': _cache_key(), 'font': config}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Font cache write warning: {e}")
+
+
+def apply_font(config):
+    """
+    Registers the font file (if matplotlib doesn't know it yet) and sets rcParams.
+    """
+    import matplotlib
+    from matplotlib import font_manager as fm
+
+    if config.get('path') and config['name'] not in {f.name for f in fm.fontManager.ttflist}:
+        fm.fontManager.addfont(config['path'])
+
+    if config.get('sans_serif'):
+        matplotlib.rcParams['font.family'] = 'sans-serif'
+        existing = [name for name in matplotlib.rcParams['font.sans-serif']
+                    if name not in config['sans_serif']]
+        matplotlib.rcParams['font.sans-serif'] = config['sans_serif'] + existing
+
+    # 解决负号显示
+    matplotlib.rcParams['axes.unicode_minus'] = False
+
+
+def setup_fonts(refresh=False):
+    """
+    Configures the CJK font once per process and returns the font config.
+    Pass refresh=True to ignore the persisted result and probe again.
+    """
+    global _configured
+    with _lock:
+        if _configured is not None and not refresh:
+            return _configured
+
+        start = time.perf_counter()
+        config = None if refresh else load_cached()
+        source = 'cached'
+        if config is None:
+            config = resolve_font()
+            if config.get('path'):
+                save_cached(config)
+                source = 'resolved'
+            else:
+                source = 'no font file found, fallback by name'
+        apply_font(config)
+        _configured = config
+
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"CJK font: {config.get('name')} ({source}, {elapsed:.0f} ms)")
+        return config
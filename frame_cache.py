@@ -0,0 +1,118 @@
+"""
+Persistent on-disk cache of validated, preprocessed frames.
+
+Frames are stored as Parquet files named by the upload's content hash,
+data_processor.PROCESSOR_VERSION and the column alias table
+(data_processor.ALIASES_KEY), so repeat uploads skip parsing across
+server restarts and processes. The directory is capped in size and evicted
+least-recently-used first (file mtime is refreshed on every hit).
+"""
+import os
+import threading
+
+from data_processor import ALIASES_KEY, PROCESSOR_VERSION
+
+CACHE_DIR = os.environ.get(
+    'CHART_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'ai-chart', 'frames'))
+MAX_BYTES = int(os.environ.get('CHART_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+# 设置 CHART_DISK_CACHE=0 关闭磁盘缓存
+ENABLED = os.environ.get('CHART_DISK_CACHE', '1') != '0'
+
+SUFFIX = '.parquet'
+
+_evict_lock = threading.Lock()
+
+
+def _available():
+    if not ENABLED:
+        return False
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def cache_path(digest):
+    return os.path.join(CACHE_DIR, f"{digest}-v{PROCESSOR_VERSION}-{ALIASES_KEY}{SUFFIX}")
+
+
+def load(digest):
+    """
+    Returns the cached frame for an upload hash, or None on a miss.
+    """
+    if not _available():
+        return None
+    path = cache_path(digest)
+    if not os.path.exists(path):
+        return None
+
+    import pandas as pd
+    try:
+        df = pd.read_parquet(path)
+    except Exception as e:
+        # 损坏或不兼容的缓存文件直接丢弃
+        print(f"Frame cache read warning, dropping {path}: {e}")
+        _remove(path)
+        return None
+
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return df
+
+
+def store(digest, df):
+    """
+    Writes a preprocessed frame to the cache, then enforces the size cap.
+    """
+    if not _available():
+        return
+    path = cache_path(digest)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path)
+        # 先写临时文件再原子替换，其他进程不会读到写了一半的文件
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Frame cache write warning: {e}")
+        _remove(tmp_path)
+        return
+    evict()
+
+
+def evict(max_bytes=None):
+    """
+    Removes least-recently-used cache files until the total size fits.
+    """
+    if max_bytes is None:
+        max_bytes = MAX_BYTES
+    with _evict_lock:
+        try:
+            entries = []
+            for entry in os.scandir(CACHE_DIR):
+                if entry.is_file() and entry.name.endswith(SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+
+def clear():
+    evict(max_bytes=0)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,212 @@
+"""
+Local history of daily counts in an embedded SQLite database.
+
+Each preprocessed upload is folded into per-day (and per-group) sums and
+upserted into one table keyed by (day, group): re-uploading a day replaces
+its counts instead of adding them twice. Reports over any period are then an
+indexed range query returning a frame shaped like preprocess_data output, so
+daily uploads accumulate history without re-uploading the whole period.
+
+Set CHART_HISTORY_DB to choose the database file.
+
+Usage:
+    python history_store.py add exports/*.xlsx
+    python history_store.py info
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from data_processor import GROUP_COLUMN, NUMERIC_COLUMNS, UNGROUPED_LABEL, METRIC_SCHEMA
+
+DB_PATH = os.environ.get(
+    'CHART_HISTORY_DB', os.path.join(os.path.expanduser('~'), '.local', 'share', 'ai-chart',
+                                     'history.sqlite3'))
+
+# 指标列 -> 数据库列名
+DB_COLUMNS = {'日报推送': 'push', '日报未推送': 'not_push', '手表佩戴': 'wear', '手表未佩戴': 'not_wear'}
+# 未分组数据的组名
+NO_GROUP = ''
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS daily (
+    day INTEGER NOT NULL,
+    grp TEXT NOT NULL,
+    {', '.join(f'{name} INTEGER NOT NULL' for name in DB_COLUMNS.values())},
+    PRIMARY KEY (day, grp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta VALUES ('revision', 0);
+"""
+
+
+def _daily_rows(df):
+    """
+    Folds a preprocessed frame into (day, group, counts...) tuples, one per
+    day and group; rows without a parsed date are dropped.
+    """
+    from analytics import aggregate, group_daily, has_groups
+
+    if has_groups(df):
+        daily = group_daily(df)
+        days = daily.index.get_level_values('date').values.astype('datetime64[D]').astype('int64')
+        groups = daily.index.get_level_values(0).astype(str)
+        counts = daily[NUMERIC_COLUMNS].to_numpy(dtype='int64')
+    else:
+        agg = aggregate(df)
+        days, counts = agg.days, agg.counts
+        groups = [NO_GROUP] * len(days)
+    return [(int(day), group, *map(int, row)) for day, group, row in zip(days, groups, counts)]
+
+
+class HistoryStore:
+    """
+    Daily counts per (day, group) in one SQLite file. Every call opens its
+    own connection, so a store can be shared by sessions and worker threads.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            # WAL：写入时其他连接仍可读取
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def upsert(self, df):
+        """
+        Writes the per-day sums of a preprocessed frame. A stored day is
+        replaced, not added to; grouped and ungrouped rows of the same day
+        replace each other. Returns the number of days written.
+        """
+        rows = _daily_rows(df)
+        if not rows:
+            return 0
+        grouped = rows[0][1] != NO_GROUP
+        columns = ', '.join(DB_COLUMNS.values())
+        updates = ', '.join(f'{name} = excluded.{name}' for name in DB_COLUMNS.values())
+        with closing(self._connect()) as conn, conn:
+            # 同一天只保留一种分组方式，避免合计重复
+            conn.executemany('DELETE FROM daily WHERE day = ? AND (grp = ?) = ?',
+                             [(day, NO_GROUP, grouped) for day in sorted({row[0] for row in rows})])
+            conn.executemany(f'INSERT INTO daily (day, grp, {columns}) VALUES (?, ?, ?, ?, ?, ?) '
+                             f'ON CONFLICT (day, grp) DO UPDATE SET {updates}', rows)
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+        return len({row[0] for row in rows})
+
+    def stored_days(self, df):
+        """
+        Returns the dates of the frame's days that the store already holds,
+        i.e. the days an upsert of `df` would replace.
+        """
+        days = {row[0] for row in _daily_rows(df)}
+        if not days:
+            return []
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT DISTINCT day FROM daily WHERE day BETWEEN ? AND ?',
+                                (min(days), max(days))).fetchall()
+        return [pd.Timestamp(np.datetime64(day, 'D')).date()
+                for day in sorted(day for day, in rows if day in days)]
+
+    def revision(self):
+        """
+        Counter bumped by every upsert; part of the cache key of queried slices.
+        """
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def date_range(self):
+        """
+        Returns the first and last stored dates, or None for an empty store.
+        """
+        with closing(self._connect()) as conn:
+            first, last = conn.execute('SELECT MIN(day), MAX(day) FROM daily').fetchone()
+        if first is None:
+            return None
+        return tuple(pd.Timestamp(np.datetime64(day, 'D')).date() for day in (first, last))
+
+    def query(self, start=None, end=None):
+        """
+        Returns the stored days in [start, end] (dates, inclusive; open when
+        None) as a preprocessed-style frame: DatetimeIndex, '日期' label,
+        metric columns and GROUP_COLUMN when any day is grouped.
+        """
+        low = -sys.maxsize if start is None else int(np.datetime64(start, 'D').astype('int64'))
+        high = sys.maxsize if end is None else int(np.datetime64(end, 'D').astype('int64'))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(f"SELECT day, grp, {', '.join(DB_COLUMNS.values())} FROM daily "
+                                'WHERE day BETWEEN ? AND ? ORDER BY day, grp', (low, high)).fetchall()
+        if not rows:
+            raise ValueError("所选日期范围内没有历史数据")
+
+        records = pd.DataFrame.from_records(rows, columns=['day', 'grp', *NUMERIC_COLUMNS])
+        dates = pd.DatetimeIndex(records['day'].to_numpy().astype('datetime64[D]'), name='date')
+        df = records[NUMERIC_COLUMNS].astype(METRIC_SCHEMA)
+        df.insert(0, '日期', pd.array(dates.strftime('%m-%d'), dtype='string'))
+        groups = records['grp']
+        if (groups != NO_GROUP).any():
+            df[GROUP_COLUMN] = groups.replace(NO_GROUP, UNGROUPED_LABEL).astype('category')
+        df.index = dates
+        df.attrs['missing'] = {}
+        df.attrs['coercions'] = {}
+        return df
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Returns the process-wide store at DB_PATH.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local report history")
+    parser.add_argument('--db', default=DB_PATH, help="database file (default: CHART_HISTORY_DB)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="upsert workbooks into the history")
+    add.add_argument('inputs', nargs='+', help="files or glob patterns")
+    add.add_argument('--sheet', help="Excel sheet name (default: the first matching sheet)")
+    commands.add_parser('info', help="show the stored date range")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.db)
+    if args.command == 'add':
+        from pipeline import load_frame
+
+        failed = 0
+        for path in sorted({p for pattern in args.inputs for p in glob.glob(pattern) or [pattern]}):
+            try:
+                with open(path, 'rb') as f:
+                    _, df = load_frame(f.read(), sheet=args.sheet)
+                replaced = len(store.stored_days(df))
+                print(f"✓ {path}: {store.upsert(df)} day(s), {replaced} replaced")
+            except (OSError, ValueError) as e:
+                failed += 1
+                print(f"✗ {path}: {e}", file=sys.stderr)
+        return 1 if failed else 0
+
+    span = store.date_range()
+    print(f"{args.db}: " + (f"{span[0]} .. {span[1]}" if span else "empty"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
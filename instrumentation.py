@@ -0,0 +1,172 @@
+"""
+Structured stage events for the report pipeline.
+
+Pipeline code wraps each unit of work in `with stage(name, ...)`, which emits
+a start and an end StageEvent (duration, rows, bytes, peak memory). Events go
+to process-wide hooks (add_hook) and to hooks scoped to the current context
+(`with hooks(fn):`), so each Streamlit session only sees its own events.
+
+Set CHART_METRICS_FILE to append every finished stage as a JSON line, and
+CHART_TRACE_MEMORY=1 to record per-stage peak Python allocations with
+tracemalloc (otherwise the process peak RSS is reported).
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_MEMORY = os.environ.get('CHART_TRACE_MEMORY', '0') == '1'
+
+_global_hooks = []
+_context_hooks = contextvars.ContextVar('stage_hooks', default=())
+
+
+class StageEvent:
+    """
+    One stage transition. `phase` is 'start' or 'end'; duration and memory
+    figures are only set on 'end' events.
+    """
+
+    def __init__(self, name, phase, **info):
+        self.name = name
+        self.phase = phase
+        self.timestamp = time.time()
+        self.duration = None
+        self.rows = info.pop('rows', None)
+        self.bytes = info.pop('bytes', None)
+        self.peak_bytes = None
+        self.error = None
+        self.info = info
+
+    def to_dict(self):
+        return {'name': self.name, 'phase': self.phase, 'timestamp': self.timestamp,
+                'duration': self.duration, 'rows': self.rows, 'bytes': self.bytes,
+                'peak_bytes': self.peak_bytes, 'error': self.error, **self.info}
+
+
+def add_hook(hook):
+    """
+    Registers a process-wide hook called with every StageEvent.
+    """
+    _global_hooks.append(hook)
+
+
+def remove_hook(hook):
+    if hook in _global_hooks:
+        _global_hooks.remove(hook)
+
+
+@contextmanager
+def hooks(*fns):
+    """
+    Registers hooks for the current context (thread / session) only.
+    """
+    token = _context_hooks.set(_context_hooks.get() + fns)
+    try:
+        yield
+    finally:
+        _context_hooks.reset(token)
+
+
+def emit(event):
+    for hook in list(_global_hooks) + list(_context_hooks.get()):
+        try:
+            hook(event)
+        except Exception as e:
+            # 监控钩子出错不能影响图表生成
+            print(f"Stage hook error in {event.name}: {e}")
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    # Linux 上 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def stage(name, **info):
+    """
+    Times a block and emits start/end events. Yields the end event so the
+    block can fill in rows/bytes/info discovered while it runs.
+    """
+    emit(StageEvent(name, 'start', **dict(info)))
+    end = StageEvent(name, 'end', **info)
+
+    traced = TRACE_MEMORY and tracemalloc.is_tracing()
+    if traced:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield end
+    except BaseException as e:
+        end.error = str(e)
+        raise
+    finally:
+        end.duration = time.perf_counter() - start
+        end.timestamp = time.time()
+        end.peak_bytes = (tracemalloc.get_traced_memory()[1] - baseline) if traced else _peak_rss()
+        emit(end)
+
+
+class MetricsFile:
+    """
+    Hook that appends finished stages to a JSON-lines file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        if event.phase != 'end':
+            return
+        line = json.dumps(event.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+class StageStats:
+    """
+    Hook that aggregates count / total / max duration per stage name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __call__(self, event):
+        if event.phase != 'end':
+            return
+        with self._lock:
+            entry = self._stats.setdefault(event.name, {'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0})
+            entry['count'] += 1
+            entry['total'] += event.duration
+            entry['max'] = max(entry['max'], event.duration)
+            entry['errors'] += event.error is not None
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(entry, mean=entry['total'] / entry['count'])
+                    for name, entry in self._stats.items()}
+
+
+# 进程级汇总，供 API / 监控读取
+stats = StageStats()
+add_hook(stats)
+
+if TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+if os.environ.get('CHART_METRICS_FILE'):
+    add_hook(MetricsFile(os.environ['CHART_METRICS_FILE']))
@@ -0,0 +1,116 @@
+"""
+Multi-page PDF report export.
+
+The first page charts the whole period; each further page charts one ISO
+week or one department (GROUP_COLUMN). Pages are written one at a time with
+PdfPages and every page's figure is released right after it is saved, so
+memory stays flat however many pages there are. Output is vector, with the
+CJK font embedded as a subsetted TrueType (Type 42) font instead of
+per-glyph Type 3 procedures, which keeps text selectable and the file small.
+
+Usage:
+    python pdf_report.py monthly.xlsx -o monthly.pdf --by week
+"""
+import argparse
+import os
+import sys
+from itertools import chain
+
+import matplotlib
+from matplotlib.backends.backend_pdf import PdfPages
+
+from chart_generator import DEFAULT_TITLE_ALL, DEFAULT_TITLES, generate_panels
+from data_processor import GROUP_COLUMN
+from instrumentation import stage
+from scheduler import checkpoint
+from utils import release_figure
+
+# PDF 中嵌入 TrueType 字体子集（默认的 Type 3 会把每个字形写成绘图指令）
+matplotlib.rcParams['pdf.fonttype'] = 42
+
+# 分页方式 -> 说明
+PAGE_MODES = {'week': '按周', 'group': f'按{GROUP_COLUMN}'}
+# 每页 2x2 面板中单个面板的尺寸（英寸）
+PDF_PANEL_SIZE = (8, 5.6)
+
+
+def iter_pages(df, by='week'):
+    """
+    Returns an iterator of (page title, frame) for the per-week or per-group
+    pages. Frames are sliced lazily, one page at a time; invalid modes and
+    data are rejected before the first page.
+    """
+    if by == 'week':
+        dated = df[df.index.notna()]
+        if dated.empty:
+            raise ValueError("数据中没有可识别的日期，无法按周分页")
+        return _week_pages(dated)
+    if by == 'group':
+        if GROUP_COLUMN not in df.columns:
+            raise ValueError(f"数据中没有{GROUP_COLUMN}列，无法按{GROUP_COLUMN}分页")
+        return ((str(group), frame) for group, frame in df.groupby(GROUP_COLUMN, observed=True))
+    raise ValueError(f"Unsupported page mode: {by}")
+
+
+def _week_pages(df):
+    # ISO 周：周一至周日
+    weeks = df.index.to_period('W-SUN')
+    for week in weeks.unique().sort_values():
+        start, end = week.start_time, week.end_time
+        year, number, _ = start.isocalendar()
+        yield f"{year} 年第 {number} 周（{start:%m-%d} ~ {end:%m-%d}）", df[weeks == week]
+
+
+def export_pdf(df, out, titles=None, colors=None, by='week', title=None):
+    """
+    Writes the PDF report of a preprocessed frame to `out` (path or binary
+    file object): an overview page, then one page per week or group.
+    Returns the number of pages written.
+    """
+    titles = titles or DEFAULT_TITLES
+    title = title or DEFAULT_TITLE_ALL
+    pages = iter_pages(df, by)
+    count = 0
+    with stage('pdf_export', rows=len(df), by=by) as event:
+        with PdfPages(out, metadata={'Title': title}) as pdf:
+            for page_title, frame in chain([(title, df)], pages):
+                checkpoint()
+                with stage('pdf_page', rows=len(frame)):
+                    fig = generate_panels(frame, titles, colors, panel_size=PDF_PANEL_SIZE,
+                                          title=page_title)
+                    try:
+                        pdf.savefig(fig)
+                    finally:
+                        # 写入后立即释放，内存占用与页数无关
+                        release_figure(fig)
+                count += 1
+        event.info['pages'] = count
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a multi-page PDF chart report")
+    parser.add_argument('input', help="workbook (.xlsx / .xls / .csv / .parquet)")
+    parser.add_argument('-o', '--output', help="PDF path (default: next to the input)")
+    parser.add_argument('--by', choices=list(PAGE_MODES), default='week',
+                        help="one page per ISO week or per department")
+    parser.add_argument('--sheet', help="Excel sheet name (default: the first matching sheet)")
+    parser.add_argument('--title', default=DEFAULT_TITLE_ALL, help="report title")
+    args = parser.parse_args(argv)
+
+    from pipeline import load_frame
+
+    try:
+        with open(args.input, 'rb') as f:
+            _, df = load_frame(f.read(), sheet=args.sheet)
+        output = args.output or f"{os.path.splitext(args.input)[0]}_report.pdf"
+        pages = export_pdf(df, output, by=args.by, title=args.title)
+    except (OSError, ValueError) as e:
+        print(f"✗ {args.input}: {e}", file=sys.stderr)
+        return 1
+    print(f"✓ {args.input}: {pages} page(s) -> {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+"""
+Cached report pipeline shared by the Streamlit app and headless entry points.
+
+Parsed frames are keyed by the upload's content hash and rendered charts by
+(data hash, chart kind, title, colors, DPI), so editing one chart title only
+re-renders that chart before re-compositing. Built figures are kept per
+(data hash, chart kind) and patched in place for title and color edits.
+"""
+import hashlib
+import io
+import os
+
+from data_processor import (build_rollups, load_data, probe_headers, validate_columns,
+                            preprocess_data)
+from chart_generator import (DEFAULT_COLORS, CHART_KINDS, Chart, generate_panels,
+                             generate_small_multiples)
+from utils import (RASTER_DPI, DEFAULT_QUALITY, LRUCache, combine_charts, encode_image,
+                   figure_to_array, figure_to_image, release_figure)
+from instrumentation import stage
+from scheduler import checkpoint
+import frame_cache
+import render_pool
+
+# 缓存容量（条目数），超出后按最近最少使用淘汰
+FRAME_CACHE_SIZE = 8
+CHART_CACHE_SIZE = 64
+# 整张面板截图每张约 18 MB（150 DPI），单独用小缓存，避免挤占单图缓存、撑大内存
+PANEL_CACHE_SIZE = 4
+# 保留可原地修改的图表对象（每份数据 4 张），淘汰时释放图表
+FIGURE_CACHE_SIZE = 16
+# 编码后的输出（图表与整合截图），按内容与编码参数缓存
+ENCODED_CACHE_SIZE = 32
+# 按数据哈希缓存的日/周/月汇总，与解析结果同样多
+ROLLUP_CACHE_SIZE = FRAME_CACHE_SIZE
+
+# 设置 CHART_PARALLEL_RENDER=1 启用多进程并行渲染
+PARALLEL_RENDER = os.environ.get('CHART_PARALLEL_RENDER', '0') == '1'
+
+_frame_cache = LRUCache(FRAME_CACHE_SIZE)
+_chart_cache = LRUCache(CHART_CACHE_SIZE)
+_panel_cache = LRUCache(PANEL_CACHE_SIZE)
+_figure_cache = LRUCache(FIGURE_CACHE_SIZE, on_evict=Chart.close)
+_encoded_cache = LRUCache(ENCODED_CACHE_SIZE)
+_rollup_cache = LRUCache(ROLLUP_CACHE_SIZE)
+# 历史库路径 -> (revision, 整库的日聚合)；写入后用 Aggregates.append 增量更新
+_history_aggregates = {}
+
+
+def file_digest(data):
+    """
+    Returns the content hash used to key cached frames and charts.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def colors_key(colors):
+    """
+    Turns a colors dict into a hashable cache key.
+    """
+    return tuple(sorted((colors or DEFAULT_COLORS).items()))
+
+
+def load_frame(data, sheet=None):
+    """
+    Parses, validates and preprocesses raw upload bytes (optionally one
+    named Excel sheet).
+    Returns (digest, df); the frame is cached and must be treated as read-only.
+    """
+    digest = file_digest(data)
+    if sheet is not None:
+        digest = file_digest(f"{digest}:{sheet}".encode('utf-8'))
+
+    def build():
+        # 内存未命中时先查磁盘缓存，再解析原始文件
+        with stage('frame_cache.load') as event:
+            df = frame_cache.load(digest)
+            event.info['hit'] = df is not None
+        if df is None:
+            checkpoint()
+            # 只读表头：表头不符的文件在完整解析前就被拒绝
+            with stage('probe_headers', bytes=len(data)) as event:
+                probe = probe_headers(io.BytesIO(data), sheet=sheet)
+                event.info['sheet'] = probe.sheet
+            with stage('load_data', bytes=len(data)) as event:
+                df = load_data(io.BytesIO(data), sheet=probe.sheet, probe=probe)
+                event.rows = len(df)
+            with stage('validate_columns', rows=len(df)):
+                df = validate_columns(df)
+            checkpoint()
+            with stage('preprocess_data', rows=len(df)):
+                df = preprocess_data(df)
+            with stage('frame_cache.store', rows=len(df)):
+                frame_cache.store(digest, df)
+        return df
+
+    with stage('load_frame', bytes=len(data)) as event:
+        event.info['cached'] = digest in _frame_cache
+        df = _frame_cache.get_or_create(digest, build)
+        event.rows = len(df)
+    return digest, df
+
+
+def _store_aggregates(store):
+    """
+    Returns (revision, Aggregates) of every day in the history store,
+    summed from the store only when no incremental update is current.
+    """
+    from analytics import Aggregates
+
+    revision = store.revision()
+    cached = _history_aggregates.get(store.path)
+    if cached is not None and cached[0] == revision:
+        return cached
+    with stage('history_aggregate') as event:
+        try:
+            agg = Aggregates.from_frame(store.query())
+        except ValueError:
+            agg = Aggregates.empty()
+        event.rows = len(agg)
+    # revision 在查询前读取：期间若有写入，下次调用会发现不一致并重新汇总
+    _history_aggregates[store.path] = (revision, agg)
+    return revision, agg
+
+
+def load_history(start=None, end=None, store=None):
+    """
+    Queries the stored days in [start, end] from the history store (see
+    history_store). Returns (digest, df) like load_frame; the slice is
+    cached until the next upsert changes the store's revision. Its daily
+    aggregates come from the store-wide aggregates kept by save_history
+    instead of being summed again.
+    """
+    import history_store
+    from analytics import remember
+    store = store or history_store.get_store()
+
+    revision = store.revision()
+
+    def build():
+        df = store.query(start, end)
+        current, agg = _store_aggregates(store)
+        if current == revision:
+            remember(df, agg.between(start, end))
+        return df
+
+    digest = file_digest(f"history:{store.path}:{revision}:{start}:{end}".encode('utf-8'))
+    with stage('load_history') as event:
+        event.info['cached'] = digest in _frame_cache
+        df = _frame_cache.get_or_create(digest, build)
+        event.rows = len(df)
+    return digest, df
+
+
+def save_history(df, store=None):
+    """
+    Upserts a preprocessed frame into the history store. Returns the number
+    of days written. The store-wide aggregates are updated in place of a
+    full re-aggregation: only the written days are read back and appended.
+    """
+    import history_store
+    from analytics import aggregate
+    store = store or history_store.get_store()
+
+    with stage('history_upsert', rows=len(df)) as event:
+        before = store.revision()
+        days = store.upsert(df)
+        event.info['days'] = days
+    cached = _history_aggregates.get(store.path)
+    if days and cached is not None and cached[0] == before and store.revision() == before + 1:
+        # 分组数据可能只覆盖某天的部分分组，所以按库中结果读回这些天的合计
+        dates = aggregate(df).dates
+        with stage('history_append', days=days):
+            written = store.query(dates[0], dates[-1])
+            _history_aggregates[store.path] = (before + 1, cached[1].append(written))
+    return days
+
+
+def load_rollups(digest, df):
+    """
+    Returns the rollup cube of a loaded frame (see
+    data_processor.build_rollups), built once per data hash.
+    """
+    with stage('build_rollups', rows=len(df)) as event:
+        event.info['cached'] = digest in _rollup_cache
+        return _rollup_cache.get_or_create(digest, lambda: build_rollups(df))
+
+
+def rollup_frame(digest, df, level):
+    """
+    Returns (digest, frame) for one level of the rollup cube. The digest
+    keys the level's charts separately from the day-by-day charts.
+    """
+    cube = load_rollups(digest, df)
+    return file_digest(f"{digest}:rollup:{level}".encode('utf-8')), cube[level]
+
+
+def _chart_key(digest, kind, title, colors, dpi=RASTER_DPI):
+    return (digest, kind, title, colors_key(colors), dpi)
+
+
+def render_chart(kind, digest, df, title, colors=None, dpi=RASTER_DPI):
+    """
+    Renders one chart and returns its rasterized RGB array, reusing a cached
+    render when the data, kind, title, colors and DPI are unchanged. Otherwise the
+    retained figure for (data, kind) is updated in place and re-rasterized.
+    """
+    def build():
+        # 被新请求取代的任务在绘制下一张图之前停止
+        checkpoint()
+        with stage('update_figure', kind=kind, rows=len(df)) as event:
+            event.info['built'] = (digest, kind) not in _figure_cache
+            chart = _figure_cache.get_or_create(
+                (digest, kind), lambda: Chart.build(kind, df, title, colors))
+        with chart.lock:
+            if not chart.closed:
+                chart.update(title, colors)
+                with stage('rasterize', kind=kind):
+                    return figure_to_array(chart.fig, dpi)
+        # 图表已被淘汰释放：直接重新生成
+        return render_pool.render_one(kind, df, title, colors, dpi)
+
+    key = _chart_key(digest, kind, title, colors, dpi)
+    with stage('render_chart', kind=kind) as event:
+        event.info['cached'] = key in _chart_cache
+        return _chart_cache.get_or_create(key, build)
+
+
+def render_report(digest, df, titles, colors=None, parallel=None, dpi=RASTER_DPI):
+    """
+    Renders all charts (in CHART_KINDS order) and composites the cached
+    rasters, so a title edit only redraws that chart.
+    With parallel rendering, charts missing from the cache are rendered
+    together on the worker pool.
+    Returns (images, combined_image).
+    """
+    if parallel is None:
+        parallel = PARALLEL_RENDER
+    if len(titles) != len(CHART_KINDS):
+        raise ValueError(f"需要 {len(CHART_KINDS)} 个标题，实际为 {len(titles)} 个")
+
+    jobs = list(zip(CHART_KINDS, titles))
+    if parallel:
+        missing = [(kind, title) for kind, title in jobs
+                   if _chart_key(digest, kind, title, colors, dpi) not in _chart_cache]
+        if missing:
+            with stage('render_parallel', rows=len(df), charts=len(missing)):
+                rendered = render_pool.render_images(df, missing, colors, dpi)
+            for (kind, title), image in zip(missing, rendered):
+                _chart_cache.put(_chart_key(digest, kind, title, colors, dpi), image)
+
+    images = [render_chart(kind, digest, df, title, colors, dpi) for kind, title in jobs]
+    with stage('combine_charts') as event:
+        combined = combine_charts(*images)
+        event.bytes = combined.width * combined.height * 3
+    return images, combined
+
+
+def render_panels(digest, df, titles, colors=None, kinds=None, ncols=2, dpi=RASTER_DPI,
+                  parallel=None):
+    """
+    Renders only the composite: all charts (`kinds`, default CHART_KINDS)
+    as panels of one figure (chart_generator.generate_panels), rasterized in
+    a single pass. For callers that never show the individual charts. With
+    parallel rendering the figure is drawn on the worker pool, outside this
+    process's GIL.
+    Returns a PIL image, kept in a small cache of its own.
+    """
+    kinds = tuple(kinds or CHART_KINDS)
+    if parallel is None:
+        parallel = PARALLEL_RENDER
+
+    def build():
+        checkpoint()
+        with stage('render_panels', rows=len(df), charts=len(kinds)) as event:
+            if parallel:
+                image = render_pool.render_composite(df, titles, colors, kinds, ncols, dpi)
+            else:
+                fig = generate_panels(df, titles, colors, kinds, ncols)
+                try:
+                    image = figure_to_image(fig, dpi)
+                finally:
+                    release_figure(fig)
+            event.bytes = image.width * image.height * 3
+            event.info['parallel'] = parallel
+        return image
+
+    key = _chart_key(digest, ('panels', kinds, ncols), tuple(titles), colors, dpi)
+    return _panel_cache.get_or_create(key, build)
+
+
+def encode_report(digest, titles, colors, images, combined, fmt='png', quality=DEFAULT_QUALITY,
+                  max_width=None, dpi=RASTER_DPI):
+    """
+    Encodes the chart images and the composite from render_report (or, with
+    no images, from render_panels) once per (content, format options); the
+    same EncodedImage bytes serve both the page and the download.
+    Returns (encoded_images, encoded_combined).
+    """
+    options = (fmt, quality, max_width)
+
+    def encode(key, image):
+        def build():
+            checkpoint()
+            with stage('encode', format=fmt) as event:
+                encoded = encode_image(image, fmt, quality, max_width)
+                event.bytes = len(encoded)
+            return encoded
+        return _encoded_cache.get_or_create(key + options, build)
+
+    encoded_images = [encode(_chart_key(digest, kind, title, colors, dpi), image)
+                      for kind, title, image in zip(CHART_KINDS, titles, images)]
+    # 拼接截图与面板截图布局不同，分开缓存
+    layout = 'report' if images else 'panels'
+    encoded_combined = encode((digest, layout, tuple(titles), colors_key(colors), dpi), combined)
+    return encoded_images, encoded_combined
+
+
+def render_groups(digest, df, title, colors=None, metric='push', style='line'):
+    """
+    Renders the per-group small-multiples figure (see
+    chart_generator.generate_small_multiples) as an RGB array, cached like
+    the individual charts.
+    """
+    def build():
+        with stage('small_multiples', rows=len(df), metric=metric, style=style):
+            fig = generate_small_multiples(df, title, colors, metric, style)
+            try:
+                return figure_to_array(fig)
+            finally:
+                release_figure(fig)
+
+    return _chart_cache.get_or_create(_chart_key(digest, f'groups_{metric}_{style}', title, colors), build)
+
+
+def render_pdf(digest, df, titles, colors=None, by='week', title=None):
+    """
+    Builds the multi-page PDF report (see pdf_report.export_pdf) in memory.
+    Returns (pdf bytes, page count), cached like the encoded images.
+    """
+    from pdf_report import export_pdf
+
+    def build():
+        buf = io.BytesIO()
+        pages = export_pdf(df, buf, titles, colors, by, title)
+        return buf.getvalue(), pages
+
+    key = (digest, 'pdf', by, tuple(titles), colors_key(colors), title)
+    return _encoded_cache.get_or_create(key, build)
+
+
+def clear_caches():
+    _frame_cache.clear()
+    _chart_cache.clear()
+    _panel_cache.clear()
+    _figure_cache.clear()
+    _encoded_cache.clear()
+    _rollup_cache.clear()
+    _history_aggregates.clear()
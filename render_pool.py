@@ -0,0 +1,141 @@
+"""
+Parallel chart rendering across a warm pool of worker processes.
+
+Workers configure fonts once at start-up and stay alive, so each report only
+pays for shipping the preprocessed frame in and the rasterized charts back.
+Either the charts of one report render side by side (render_images) or
+whole panel composites render outside the calling process's GIL
+(render_composite), so concurrent API requests use several cores. Falls
+back to in-process serial rendering when a pool cannot be created or breaks.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from chart_generator import CHART_FUNCTIONS, generate_panels
+from fonts import setup_fonts
+from utils import RASTER_DPI, figure_to_array, figure_to_image, release_figure
+
+# 默认进程数：4 张图表，最多 4 个进程
+DEFAULT_WORKERS = min(len(CHART_FUNCTIONS), os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    # 进程启动时完成字体配置，之后的渲染任务无需重复加载
+    setup_fonts()
+
+
+def _noop():
+    return os.getpid()
+
+
+def render_one(kind, df, title, colors=None, dpi=RASTER_DPI):
+    """
+    Renders a single chart kind and returns its RGB pixel array.
+    Runs inside a worker process, or in-process on the serial path.
+    """
+    fig = CHART_FUNCTIONS[kind](df, title, colors)
+    try:
+        return figure_to_array(fig, dpi)
+    finally:
+        # 光栅化后立即释放图表，长时间运行的服务内存保持平稳
+        release_figure(fig)
+
+
+def get_pool(workers=DEFAULT_WORKERS):
+    """
+    Returns the shared worker pool, creating it on first use.
+    Returns None if process pools are unavailable on this platform.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None and workers > 1:
+            try:
+                # spawn：Streamlit 服务是多线程进程，fork 不安全
+                ctx = multiprocessing.get_context('spawn')
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                            initializer=_init_worker)
+            except (OSError, ImportError, NotImplementedError, ValueError) as e:
+                print(f"Render pool unavailable, using serial rendering: {e}")
+                _pool = None
+        return _pool
+
+
+def warm_up(workers=DEFAULT_WORKERS):
+    """
+    Starts the worker processes ahead of the first report.
+    """
+    pool = get_pool(workers)
+    if pool is None:
+        return False
+    try:
+        for future in [pool.submit(_noop) for _ in range(workers)]:
+            future.result()
+    except (BrokenProcessPool, OSError):
+        shutdown()
+        return False
+    return True
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown)
+
+
+def render_images(df, jobs, colors=None, dpi=RASTER_DPI, workers=DEFAULT_WORKERS):
+    """
+    Renders a list of (kind, title) jobs in parallel.
+    Returns the rasterized RGB arrays in job order.
+    """
+    pool = get_pool(workers) if len(jobs) > 1 else None
+    if pool is not None:
+        try:
+            futures = [pool.submit(render_one, kind, df, title, colors, dpi)
+                       for kind, title in jobs]
+            return [future.result() for future in futures]
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Render pool failed, falling back to serial rendering: {e}")
+            shutdown()
+
+    return [render_one(kind, df, title, colors, dpi) for kind, title in jobs]
+
+
+def render_panels(df, titles, colors=None, kinds=None, ncols=2, dpi=RASTER_DPI):
+    """
+    Renders the panel composite (chart_generator.generate_panels) and
+    returns it as a PIL image. Runs inside a worker process, or in-process
+    on the serial path.
+    """
+    fig = generate_panels(df, titles, colors, kinds, ncols)
+    try:
+        return figure_to_image(fig, dpi)
+    finally:
+        release_figure(fig)
+
+
+def render_composite(df, titles, colors=None, kinds=None, ncols=2, dpi=RASTER_DPI,
+                     workers=DEFAULT_WORKERS):
+    """
+    Renders one panel composite on the worker pool and returns the PIL image.
+    """
+    pool = get_pool(workers)
+    if pool is not None:
+        try:
+            return pool.submit(render_panels, df, titles, colors, kinds, ncols, dpi).result()
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Render pool failed, falling back to serial rendering: {e}")
+            shutdown()
+
+    return render_panels(df, titles, colors, kinds, ncols, dpi)
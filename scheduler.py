@@ -0,0 +1,172 @@
+"""
+Shared render scheduler for concurrent sessions.
+
+Every Streamlit session (and the HTTP API) submits its pipeline work here
+instead of rendering on its own script thread:
+
+- a fixed pool of worker threads bounds how many renders compete for the GIL
+- admission is bounded (workers + queue); beyond that submit() raises
+  SchedulerBusy so callers can show "server busy" instead of piling up
+- identical in-flight requests (same key, e.g. file hash + options) share
+  one job
+- a session's newer submission cancels its previous job unless another
+  caller still waits for it; running jobs stop at the next checkpoint()
+
+Jobs run in a copy of the submitter's contextvars, so context-scoped stage
+hooks (instrumentation.hooks) still see the work. A coalesced job reports
+its stages to the first submitter only.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+DEFAULT_WORKERS = int(os.environ.get('CHART_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+DEFAULT_QUEUE = int(os.environ.get('CHART_RENDER_QUEUE', 8))
+
+_current_job = contextvars.ContextVar('render_job', default=None)
+
+
+class SchedulerBusy(RuntimeError):
+    """
+    Raised by submit() when the worker pool and its queue are full.
+    """
+
+
+class Cancelled(Exception):
+    """
+    Raised inside a job that was superseded by a newer submission.
+    """
+
+
+def checkpoint():
+    """
+    Raises Cancelled if the job running on this thread has been cancelled.
+    Long pipeline steps call it between units of work.
+    """
+    job = _current_job.get()
+    if job is not None and job.cancelled.is_set():
+        raise Cancelled(f"job {job.key!r} was superseded")
+
+
+class Job:
+    """
+    One scheduled unit of work, possibly shared by several callers.
+    """
+
+    def __init__(self, key, pinned):
+        self.key = key
+        self.future = None
+        self.cancelled = threading.Event()
+        # 等待结果的会话；pinned 表示有不属于任何会话的调用方（不可取消）
+        self.sessions = set()
+        self.pinned = pinned
+
+    def result(self, timeout=None):
+        """
+        Waits for the job. Raises concurrent.futures.TimeoutError after
+        `timeout` seconds and Cancelled if the job was superseded.
+        """
+        try:
+            return self.future.result(timeout)
+        except CancelledError:
+            raise Cancelled(f"job {self.key!r} was superseded")
+
+    def done(self):
+        return self.future.done()
+
+
+class RenderScheduler:
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='render')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        # 可重入：已完成或被取消的任务会在持锁的线程里同步触发 _finish
+        self._lock = threading.RLock()
+        self._jobs = {}
+        self._sessions = {}
+        self.counters = {'submitted': 0, 'coalesced': 0, 'rejected': 0, 'cancelled': 0}
+
+    def submit(self, key, fn, *args, session=None, **kwargs):
+        """
+        Schedules fn(*args, **kwargs) under `key` and returns its Job.
+        An in-flight job with the same key is returned instead of starting
+        a new one, unless that job was already cancelled. With `session`, the session's previous job is cancelled
+        if nobody else waits for it.
+        Raises SchedulerBusy when no slot is free.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            # 已取消的任务还在收尾时不再合并，同一 key 重新提交一个新任务
+            if job is not None and job.cancelled.is_set():
+                job = None
+            if job is not None:
+                self.counters['coalesced'] += 1
+                job.pinned = job.pinned or session is None
+            else:
+                if not self._slots.acquire(blocking=False):
+                    self.counters['rejected'] += 1
+                    raise SchedulerBusy("render queue is full")
+                self.counters['submitted'] += 1
+                job = Job(key, pinned=session is None)
+                self._jobs[key] = job
+                # 在提交方的上下文副本中执行，作用域内的阶段钩子随任务进入工作线程
+                context = contextvars.copy_context()
+                job.future = self._executor.submit(context.run, self._run, job, fn, args, kwargs)
+                job.future.add_done_callback(lambda _, job=job: self._finish(job))
+
+            if session is not None:
+                previous = self._sessions.get(session)
+                if previous is not None and previous is not job:
+                    self._detach(previous, session)
+                self._sessions[session] = job
+                job.sessions.add(session)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        _current_job.set(job)
+        checkpoint()
+        return fn(*args, **kwargs)
+
+    def _detach(self, job, session):
+        # 调用时已持有 self._lock
+        job.sessions.discard(session)
+        if job.sessions or job.pinned or job.done():
+            return
+        job.cancelled.set()
+        self.counters['cancelled'] += 1
+        # 尚未开始的任务直接取消；运行中的任务在下一个 checkpoint() 处停止
+        job.future.cancel()
+
+    def _finish(self, job):
+        with self._lock:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            for session in job.sessions:
+                if self._sessions.get(session) is job:
+                    del self._sessions[session]
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._jobs), workers=self.workers,
+                        queue_size=self.queue_size)
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Returns the process-wide scheduler shared by all sessions.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RenderScheduler()
+        return _scheduler
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from analytics import Aggregates, aggregate
+
+
+def _frame(dates, push, not_push):
+    n = len(dates)
+    return pd.DataFrame({'日期': [''] * n, '日报推送': push, '日报未推送': not_push,
+                         '手表佩戴': [1] * n, '手表未佩戴': [1] * n},
+                        index=pd.DatetimeIndex(dates, name='date'))
+
+
+def test_rows_of_one_day_are_summed():
+    agg = aggregate(_frame(['2025-01-02', '2025-01-01', '2025-01-02'], [1, 2, 3], [1, 0, 1]))
+    assert list(agg.dates.strftime('%m-%d')) == ['01-01', '01-02']
+    assert agg.counts[:, 0].tolist() == [2, 4]
+    assert agg.totals['日报推送'] == 6
+
+
+def test_rolling_rate_counts_calendar_days():
+    dates = pd.date_range('2025-01-01', periods=10).delete([3, 4])
+    agg = aggregate(_frame(dates, [1] * 8, [0, 0, 0, 1, 1, 1, 1, 1]))
+    rates = agg.rolling_rate('push', 7)
+    # 01-10 的 7 天窗口为 01-04 ~ 01-10，缺失的日期不计
+    assert rates[-1] == 50.0
+    assert agg.period_rate('push', 7) == 50.0
+    assert agg.period_rate('push', 3, offset=7) == 100.0
+
+
+def test_week_over_week_and_undated_rows():
+    dates = list(pd.date_range('2025-01-01', periods=14)) + [pd.NaT]
+    agg = aggregate(_frame(dates, [1] * 15, [0] * 7 + [1] * 7 + [5]))
+    assert agg.week_over_week('push')[-1] == -50.0
+    # 无日期的行只计入合计
+    assert len(agg) == 14
+    assert agg.totals['日报未推送'] == 12
+    assert np.isnan(agg.zscores('push')).sum() == 0
+
+
+def test_append_replaces_overlapping_days():
+    first = _frame(pd.date_range('2025-01-01', periods=5), [1, 1, 1, 1, 1], [0, 0, 0, 0, 0])
+    second = _frame(pd.date_range('2025-01-04', periods=4), [2, 2, 2, 2], [2, 2, 2, 2])
+    agg = Aggregates.from_frame(first).append(second)
+    # 重叠的 01-04、01-05 被替换而不是累加，结果与整体重新汇总一致
+    expected = Aggregates.from_frame(pd.concat([first.iloc[:3], second]))
+    assert agg.days.tolist() == expected.days.tolist()
+    assert agg.counts.tolist() == expected.counts.tolist()
+    assert agg.cumsum.tolist() == expected.cumsum.tolist()
+    assert agg.totals['日报推送'] == 11
+
+
+def test_append_new_days_and_between():
+    history = Aggregates.empty()
+    for start in ('2025-01-01', '2025-01-08', '2025-01-03'):
+        dates = pd.date_range(start, periods=7)
+        history = history.append(_frame(dates, [1] * 7, [1] * 7))
+    assert len(history) == 14
+    week = history.between('2025-01-08', '2025-01-14')
+    assert len(week) == 7
+    assert week.rate('push') == 50.0
+    assert week.cumsum.tolist() == Aggregates(week.days, week.counts, week.undated).cumsum.tolist()
+    assert len(history.between(end='2025-01-02')) == 2
@@ -0,0 +1,45 @@
+import numpy as np
+
+from chart_generator import DOWNSAMPLE_POINTS, generate_chart, lttb_indices
+from create_dummy_data import make_frame
+from data_processor import preprocess_data, validate_columns
+from utils import release_figure
+
+
+def test_lttb_keeps_endpoints_and_order():
+    x = np.arange(1000)
+    y = np.sin(x / 50.0)
+    keep = lttb_indices(x, y, 100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    # 每个桶选一个点，索引严格递增且不重复
+    assert (np.diff(keep) > 0).all()
+
+
+def test_lttb_short_series_is_unchanged():
+    y = np.arange(10.0)
+    assert list(lttb_indices(np.arange(10), y, 10)) == list(range(10))
+    assert list(lttb_indices(np.arange(10), y, 50)) == list(range(10))
+    assert list(lttb_indices(np.arange(10), y, 2)) == list(range(10))
+
+
+def test_lttb_preserves_spikes():
+    y = np.zeros(5000)
+    y[1234], y[3210] = 100.0, -100.0
+    keep = lttb_indices(np.arange(5000), y, 50)
+    assert 1234 in keep and 3210 in keep
+
+
+def test_large_line_chart_is_downsampled():
+    df = preprocess_data(validate_columns(make_frame(3000)))
+    fig = generate_chart('line_push', df, 'push')
+    try:
+        lines = fig.axes[0].get_lines()
+        assert lines
+        for line in lines:
+            assert len(line.get_xdata()) == DOWNSAMPLE_POINTS
+            # 峰值不被抽稀掉
+            column = line.get_label()
+            assert line.get_ydata().max() == df[column].max()
+    finally:
+        release_figure(fig)
@@ -0,0 +1,63 @@
+import io
+
+import pandas as pd
+import pytest
+
+from data_processor import load_data, preprocess_data, probe_headers, validate_columns
+
+
+def _csv(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+def test_exact_header_wins_over_alias():
+    # 规范列名出现在别名匹配的列之后时，仍应读取规范列
+    file = _csv("时间,日期,推送,日报推送,日报未推送,手表佩戴,手表未佩戴\n"
+                "08:00,2025-11-25,x,10,2,8,4\n"
+                "09:00,2025-11-26,y,12,1,9,3\n")
+    probe = probe_headers(file)
+    assert sorted(probe.columns.values()) == sorted(
+        ['日期', '日报推送', '日报未推送', '手表佩戴', '手表未佩戴'])
+    df = preprocess_data(validate_columns(load_data(file, probe=probe)))
+    assert list(df['日报推送']) == [10, 12]
+    assert list(df.index.strftime('%Y-%m-%d')) == ['2025-11-25', '2025-11-26']
+    assert not df.attrs['coercions']
+
+
+def test_alias_header():
+    file = _csv("Date,Pushed,Not Push,Worn,Unworn\n2025-11-25,10,2,8,4\n")
+    df = validate_columns(load_data(file))
+    assert list(df.columns) == ['日期', '日报推送', '日报未推送', '手表佩戴', '手表未佩戴']
+
+
+def test_ambiguous_header_is_rejected():
+    file = _csv("日期,推送数,已推送,日报未推送,手表佩戴,手表未佩戴\n2025-11-25,10,10,2,8,4\n")
+    with pytest.raises(ValueError, match="歧义"):
+        probe_headers(file)
+
+
+def test_validate_columns_prefers_exact_name():
+    df = pd.DataFrame({'推送数': [1], '日期': ['2025-11-25'], '日报推送': [5], '日报未推送': [1],
+                       '手表佩戴': [2], '手表未佩戴': [3]})
+    df = validate_columns(df)
+    assert list(df['日报推送']) == [5]
+    assert list(df.columns).count('日报推送') == 1
+
+
+def _frame(dates):
+    n = len(dates)
+    return pd.DataFrame({'日期': dates, '日报推送': [1] * n, '日报未推送': [1] * n,
+                         '手表佩戴': [1] * n, '手表未佩戴': [1] * n})
+
+
+def test_yearless_dates_roll_over_the_year():
+    df = preprocess_data(_frame(['12-30', '12-31', '01-01', '01-02']), reference='2026-01-05')
+    assert list(df.index.strftime('%Y-%m-%d')) == ['2025-12-30', '2025-12-31', '2026-01-01',
+                                                   '2026-01-02']
+    assert list(df['日期']) == ['12-30', '12-31', '01-01', '01-02']
+
+
+def test_yearless_dates_are_not_in_the_future():
+    df = preprocess_data(_frame(['12月30日', '12月31日']), reference='2026-03-01')
+    assert list(df.index.year) == [2025, 2025]
+    assert (df.index.year > 1900).all()
@@ -0,0 +1,65 @@
+import pandas as pd
+
+from create_dummy_data import make_frame
+from data_processor import preprocess_data, validate_columns
+from history_store import HistoryStore
+
+
+def _frame(start, rows, groups=0, seed=0):
+    return preprocess_data(validate_columns(make_frame(rows, start=start, groups=groups, seed=seed)))
+
+
+def test_upsert_replaces_stored_days(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+    first = _frame('2025-01-01', 10)
+    assert store.stored_days(first) == []
+    assert store.upsert(first) == 10
+
+    # 与已存日期重叠的上传替换这些天，而不是累加
+    second = _frame('2025-01-06', 10, seed=1)
+    assert len(store.stored_days(second)) == 5
+    revision = store.revision()
+    assert store.upsert(second) == 10
+    assert store.revision() == revision + 1
+
+    stored = store.query()
+    assert len(stored) == 15
+    overlap = pd.Timestamp('2025-01-08')
+    assert stored.loc[overlap, '日报推送'] == second.loc[overlap, '日报推送']
+    assert stored.loc[pd.Timestamp('2025-01-02'), '日报推送'] == first.loc[
+        pd.Timestamp('2025-01-02'), '日报推送']
+
+
+def test_grouped_upload_replaces_ungrouped_day(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+    store.upsert(_frame('2025-01-01', 3))
+    grouped = _frame('2025-01-01', 6, groups=2)
+    store.upsert(grouped)
+
+    stored = store.query()
+    assert set(stored['部门'].astype(str)) == {'部门01', '部门02'}
+    # 合计只来自分组数据，未分组的旧行已被替换
+    assert stored['日报推送'].sum() == grouped['日报推送'].sum()
+    assert store.date_range() == (pd.Timestamp('2025-01-01').date(), pd.Timestamp('2025-01-03').date())
+
+
+def test_saved_days_update_history_aggregates(tmp_path):
+    from analytics import Aggregates, aggregate
+    from instrumentation import hooks
+    from pipeline import load_history, save_history
+
+    store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+    save_history(_frame('2025-01-01', 10, groups=2), store)
+    load_history(store=store)
+    # 之后的写入增量并入整库聚合，切片直接取用，不再重新汇总
+    stages = []
+    with hooks(lambda event: event.phase == 'end' and stages.append(event.name)):
+        save_history(_frame('2025-01-06', 10, groups=2, seed=1), store)
+        _, df = load_history('2025-01-03', '2025-01-12', store=store)
+    assert 'history_append' in stages and 'history_aggregate' not in stages
+    agg = aggregate(df)
+    expected = Aggregates.from_frame(store.query('2025-01-03', '2025-01-12'))
+    assert agg is not expected
+    assert agg.days.tolist() == expected.days.tolist()
+    assert agg.counts.tolist() == expected.counts.tolist()
+    assert agg.cumsum.tolist() == expected.cumsum.tolist()
@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+
+from scheduler import Cancelled, RenderScheduler, SchedulerBusy, checkpoint
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = RenderScheduler(workers=1, queue_size=3)
+    yield scheduler
+    scheduler.shutdown(wait=True)
+
+
+def _blocker(scheduler, key='block', session=None):
+    # 占住唯一的工作线程，直到 release.set()
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(TIMEOUT)
+        return key
+
+    job = scheduler.submit(key, work, session=session)
+    assert started.wait(TIMEOUT)
+    return job, release
+
+
+def test_same_key_coalesces(scheduler):
+    blocker, release = _blocker(scheduler)
+    first = scheduler.submit('report', lambda: 'png')
+    second = scheduler.submit('report', lambda: 'other')
+    assert second is first
+    assert scheduler.counters['coalesced'] == 1
+    assert scheduler.counters['submitted'] == 2
+    release.set()
+    assert first.result(TIMEOUT) == 'png'
+    assert blocker.result(TIMEOUT) == 'block'
+
+
+def test_admission_is_bounded(scheduler):
+    blocker, release = _blocker(scheduler)
+    queued = [scheduler.submit(f'queued-{i}', lambda i=i: i) for i in range(3)]
+    # 工作线程与队列都已占满
+    with pytest.raises(SchedulerBusy):
+        scheduler.submit('rejected', lambda: 'rejected')
+    assert scheduler.counters['rejected'] == 1
+    release.set()
+    assert [job.result(TIMEOUT) for job in queued] == [0, 1, 2]
+    blocker.result(TIMEOUT)
+    # 任务结束后名额归还
+    assert scheduler.submit('later', lambda: 'later').result(TIMEOUT) == 'later'
+
+
+def test_newer_submission_cancels_queued_job(scheduler):
+    blocker, release = _blocker(scheduler)
+    old = scheduler.submit('old', lambda: 'old', session='s')
+    new = scheduler.submit('new', lambda: 'new', session='s')
+    release.set()
+    assert old.cancelled.is_set()
+    assert scheduler.counters['cancelled'] == 1
+    with pytest.raises(Cancelled):
+        old.result(TIMEOUT)
+    assert new.result(TIMEOUT) == 'new'
+    blocker.result(TIMEOUT)
+
+
+def test_running_job_stops_at_checkpoint(scheduler):
+    started, proceed = threading.Event(), threading.Event()
+    reached = []
+
+    def work():
+        started.set()
+        proceed.wait(TIMEOUT)
+        checkpoint()
+        reached.append('after checkpoint')
+        return 'old'
+
+    old = scheduler.submit('old', work, session='s')
+    assert started.wait(TIMEOUT)
+    new = scheduler.submit('new', lambda: 'new', session='s')
+    proceed.set()
+    with pytest.raises(Cancelled):
+        old.result(TIMEOUT)
+    assert reached == []
+    assert new.result(TIMEOUT) == 'new'
+
+
+def test_job_with_other_waiters_is_not_cancelled(scheduler):
+    blocker, release = _blocker(scheduler)
+    # 还有别的会话等待，或有不属于会话的调用方（API、批处理）时，换任务不会取消它
+    shared = scheduler.submit('shared', lambda: 'shared', session='a')
+    scheduler.submit('shared', lambda: 'shared', session='b')
+    pinned = scheduler.submit('pinned', lambda: 'pinned')
+    scheduler.submit('pinned', lambda: 'pinned', session='c')
+    scheduler.submit('next', lambda: 'next', session='a')
+    scheduler.submit('next', lambda: 'next', session='c')
+    assert not shared.cancelled.is_set()
+    assert not pinned.cancelled.is_set()
+    assert scheduler.counters['cancelled'] == 0
+    release.set()
+    assert shared.result(TIMEOUT) == 'shared'
+    assert pinned.result(TIMEOUT) == 'pinned'
+    blocker.result(TIMEOUT)
+
+
+def test_resubmitting_a_cancelled_key_starts_a_new_job():
+    scheduler = RenderScheduler(workers=2, queue_size=2)
+    try:
+        started, proceed = threading.Event(), threading.Event()
+
+        def report():
+            started.set()
+            proceed.wait(TIMEOUT)
+            checkpoint()
+            return 'report'
+
+        # 渲染中途的重跑先提交加载任务（取消报告），再以相同的 key 提交报告
+        old = scheduler.submit('report', report, session='s')
+        assert started.wait(TIMEOUT)
+        assert scheduler.submit('load', lambda: 'frame', session='s').result(TIMEOUT) == 'frame'
+        assert old.cancelled.is_set()
+        finish = threading.Event()
+        new = scheduler.submit('report', lambda: finish.wait(TIMEOUT) and 'report', session='s')
+        assert new is not old
+        assert scheduler.counters['coalesced'] == 0
+        proceed.set()
+        with pytest.raises(Cancelled):
+            old.result(TIMEOUT)
+        # 旧任务收尾时不会把新任务移出表：同一 key 的后续请求仍合并到新任务
+        assert scheduler.submit('report', lambda: 'other', session='t') is new
+        finish.set()
+        assert new.result(TIMEOUT) == 'report'
+    finally:
+        scheduler.shutdown(wait=True)
@@ -1,72 +1,243 @@
 import io
-from PIL import Image, ImageDraw, ImageFont
+import math
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
 
-def combine_charts(fig1, fig2, fig3, fig4, title="图表汇总"):
+# 整合截图使用的光栅化 DPI
+RASTER_DPI = 150
+
+# 输出格式：名称 -> (PIL 格式, MIME 类型, 扩展名)
+OUTPUT_FORMATS = {
+    'png': ('PNG', 'image/png', 'png'),
+    'png8': ('PNG', 'image/png', 'png'),
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+DEFAULT_QUALITY = 85
+
+
+class LRUCache:
+    """
+    A small thread-safe LRU cache with a bounded number of entries.
+    on_evict(value), if given, is called for each evicted value outside the lock.
+    """
+
+    def __init__(self, maxsize=32, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            # 超出容量时淘汰最久未使用的条目
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[1])
+        if self.on_evict is not None:
+            for old_value in evicted:
+                self.on_evict(old_value)
+
+    def get_or_create(self, key, factory):
+        """
+        Returns the cached value for key, calling factory() on a miss.
+        The factory runs outside the lock so slow builds don't block other keys.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            evicted = list(self._data.values())
+            self._data.clear()
+        if self.on_evict is not None:
+            for old_value in evicted:
+                self.on_evict(old_value)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+def figure_to_array(fig, dpi=RASTER_DPI, pad_inches=0.1):
+    """
+    Draws a figure once at the given DPI and returns its RGB pixels as a
+    uint8 array of shape (height, width, 3), cropped to the tight bounding
+    box like savefig(bbox_inches='tight') but without a PNG round-trip.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    canvas = fig.canvas
+    if not isinstance(canvas, FigureCanvasAgg):
+        canvas = FigureCanvasAgg(fig)
+
+    original_dpi = fig.dpi
+    fig.set_dpi(dpi)
+    try:
+        canvas.draw()
+        bbox = fig.get_tightbbox(canvas.get_renderer())
+        rgba = np.asarray(canvas.buffer_rgba())
+    finally:
+        fig.set_dpi(original_dpi)
+
+    # 紧凑边界（英寸，原点在左下）换算成像素行列，并裁剪到画布范围内
+    height, width = rgba.shape[:2]
+    x0 = max(0, math.floor((bbox.x0 - pad_inches) * dpi))
+    x1 = min(width, math.ceil((bbox.x1 + pad_inches) * dpi))
+    y0 = max(0, height - math.ceil((bbox.y1 + pad_inches) * dpi))
+    y1 = min(height, height - math.floor((bbox.y0 - pad_inches) * dpi))
+    # 图表背景为不透明白色，直接丢弃 alpha 通道
+    return np.ascontiguousarray(rgba[y0:y1, x0:x1, :3])
+
+
+def figure_to_image(fig, dpi=RASTER_DPI):
+    """
+    Rasterizes a matplotlib figure into a PIL Image.
     """
-    Combines 4 matplotlib figures into a single 2x2 image with high quality.
-    Layout:
+    return Image.fromarray(figure_to_array(fig, dpi))
+
+
+def _as_rgb_array(chart):
+    # 接受图表对象、PIL 图片或已光栅化的数组
+    if isinstance(chart, np.ndarray):
+        return chart
+    if isinstance(chart, Image.Image):
+        return np.asarray(chart.convert('RGB'))
+    return figure_to_array(chart)
+
+
+def release_figure(fig):
+    """
+    Frees a figure once it has been rasterized.
+    Figures created through pyplot are also removed from its figure manager.
+    """
+    pyplot = sys.modules.get('matplotlib.pyplot')
+    if pyplot is not None:
+        pyplot.close(fig)
+    fig.clear()
+
+
+def combine_charts(*charts, title="图表汇总", ncols=2):
+    """
+    Combines any number of charts into a single grid image, ncols per row
+    (the default report is 2x2):
     [Fig1] [Fig2]
     [Fig3] [Fig4]
+    Each chart may be a figure, a PIL Image or an RGB array from
+    figure_to_array; rasters are copied once into a preallocated canvas.
     """
-    # Convert figures to PIL Images with high DPI for clarity
-    images = []
-    for fig in [fig1, fig2, fig3, fig4]:
-        buf = io.BytesIO()
-        # 使用高DPI保存，确保清晰度
-        fig.savefig(buf, format='png', bbox_inches='tight', dpi=150, facecolor='white')
-        buf.seek(0)
-        img = Image.open(buf)
-        images.append(img)
+    if not charts:
+        raise ValueError("combine_charts needs at least one chart")
+    arrays = [_as_rgb_array(chart) for chart in charts]
+    ncols = max(1, min(ncols, len(arrays)))
+    nrows = math.ceil(len(arrays) / ncols)
     
-    # 确保所有图片尺寸一致（取最大尺寸）
-    max_width = max(img.size[0] for img in images)
-    max_height = max(img.size[1] for img in images)
-    
-    # 将所有图片调整为相同尺寸
-    resized_images = []
-    for img in images:
-        # 创建白色背景
-        new_img = Image.new('RGB', (max_width, max_height), 'white')
-        # 居中粘贴原图
-        offset_x = (max_width - img.size[0]) // 2
-        offset_y = (max_height - img.size[1]) // 2
-        new_img.paste(img, (offset_x, offset_y))
-        resized_images.append(new_img)
+    # 每个格子取最大尺寸，图表在格子内居中
+    max_width = max(arr.shape[1] for arr in arrays)
+    max_height = max(arr.shape[0] for arr in arrays)
     
     # 设置间距和边距
     padding = 30  # 图表之间的间距
     margin = 40   # 外边距
     
     # 计算总尺寸
-    total_width = max_width * 2 + padding + margin * 2
-    total_height = max_height * 2 + padding + margin * 2
+    total_width = max_width * ncols + padding * (ncols - 1) + margin * 2
+    total_height = max_height * nrows + padding * (nrows - 1) + margin * 2
     
-    # 创建白色背景的组合图像
-    combined_image = Image.new('RGB', (total_width, total_height), 'white')
+    # 预分配白色画布，直接写入各图表像素
+    canvas = np.full((total_height, total_width, 3), 255, dtype=np.uint8)
     
-    # 粘贴图表
-    # 左上
-    combined_image.paste(resized_images[0], (margin, margin))
-    # 右上
-    combined_image.paste(resized_images[1], (max_width + padding + margin, margin))
-    # 左下
-    combined_image.paste(resized_images[2], (margin, max_height + padding + margin))
-    # 右下
-    combined_image.paste(resized_images[3], (max_width + padding + margin, max_height + padding + margin))
+    for index, arr in enumerate(arrays):
+        row, col = divmod(index, ncols)
+        height, width = arr.shape[:2]
+        top = margin + row * (max_height + padding) + (max_height - height) // 2
+        left = margin + col * (max_width + padding) + (max_width - width) // 2
+        canvas[top:top + height, left:left + width] = arr
     
     # 添加分隔线，使布局更清晰
-    draw = ImageDraw.Draw(combined_image)
-    line_color = '#E0E0E0'
+    line_color = (0xE0, 0xE0, 0xE0)
     line_width = 2
     
     # 垂直分隔线
-    vertical_x = max_width + margin + padding // 2
-    draw.line([(vertical_x, margin), (vertical_x, total_height - margin)], 
-              fill=line_color, width=line_width)
+    for col in range(1, ncols):
+        vertical_x = margin + col * (max_width + padding) - padding // 2
+        canvas[margin:total_height - margin, vertical_x - line_width // 2:vertical_x + line_width // 2] = line_color
     
     # 水平分隔线
-    horizontal_y = max_height + margin + padding // 2
-    draw.line([(margin, horizontal_y), (total_width - margin, horizontal_y)], 
-              fill=line_color, width=line_width)
+    for row in range(1, nrows):
+        horizontal_y = margin + row * (max_height + padding) - padding // 2
+        canvas[horizontal_y - line_width // 2:horizontal_y + line_width // 2, margin:total_width - margin] = line_color
     
-    return combined_image
+    return Image.fromarray(canvas)
+
+
+class EncodedImage:
+    """
+    Encoded image bytes plus what is needed to serve them (MIME type, file
+    extension, pixel size). Produced once and shared by display and download.
+    """
+
+    def __init__(self, data, mime, extension, size):
+        self.data = data
+        self.mime = mime
+        self.extension = extension
+        self.size = size
+
+    def __len__(self):
+        return len(self.data)
+
+
+def encode_image(image, fmt='png', quality=DEFAULT_QUALITY, max_width=None):
+    """
+    Encodes a PIL Image or RGB array into one of OUTPUT_FORMATS:
+    - 'png': lossless, optimized deflate
+    - 'png8': palette-quantized (256 colors) PNG, much smaller for flat charts
+    - 'webp' / 'jpeg': lossy with the given quality (1-100)
+    Images wider than max_width are downscaled first.
+    Returns an EncodedImage.
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {fmt}")
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    if max_width and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.Resampling.LANCZOS)
+
+    pil_format, mime, extension = OUTPUT_FORMATS[fmt]
+    options = {}
+    if fmt == 'png':
+        options = {'optimize': True}
+    elif fmt == 'png8':
+        # 图表颜色数有限，量化为调色板图像几乎无损
+        image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        options = {'optimize': True}
+    elif fmt == 'webp':
+        options = {'quality': quality, 'method': 4}
+    elif fmt == 'jpeg':
+        # 文字边缘在色度下采样后会发虚，高质量时保留完整色度
+        options = {'quality': quality, 'optimize': True, 'subsampling': 0 if quality >= 90 else 2}
+
+    buf = io.BytesIO()
+    image.save(buf, format=pil_format, **options)
+    return EncodedImage(buf.getvalue(), mime, extension, image.size)
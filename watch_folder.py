@@ -0,0 +1,253 @@
+"""
+Watch mode: keeps report images and stats up to date for a shared folder.
+
+The folder is polled every --interval seconds. A workbook is refreshed when
+its mtime or size changes, has stayed unchanged for --settle seconds (so
+half-written exports are skipped) and its content hash differs from the last
+run. Only the stages whose inputs changed run again:
+
+- same bytes (file touched or re-saved identically): nothing runs
+- new bytes: the file is parsed (unless the disk frame cache has it)
+- same parsed data (e.g. only formatting changed): charts and stats are
+  reused; outputs are only rewritten if missing
+
+A workbook whose outputs were deleted is picked up by the next scan even if
+the workbook itself did not change.
+
+Fonts, the pipeline caches and the render workers stay warm for the whole
+session, so a refresh costs only the work above. Outputs are written next to
+each workbook (or into --out-dir) like batch_report: <name>_report.<ext>,
+<name>_stats.json and, for grouped data, <name>_groups.png.
+
+Usage:
+    python watch_folder.py exports/ --format png8 --history
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+from batch_report import _to_builtin, expand_inputs, output_stem
+from chart_specs import CHART_KINDS
+
+DEFAULT_INTERVAL = 2.0
+DEFAULT_SETTLE = 2.0
+
+
+class WatchedFile:
+    """
+    What was last seen and produced for one workbook.
+    """
+
+    def __init__(self, stat):
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.digest = None       # 文件内容哈希
+        self.data_key = None     # 解析后数据的哈希
+        self.outputs = []
+
+
+def frame_digest(df):
+    """
+    Hashes the parsed data, so files that differ only in formatting share
+    their charts and stats.
+    """
+    import pandas as pd
+    values = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return hashlib.sha256(values.tobytes() + repr(list(df.columns)).encode('utf-8')).hexdigest()
+
+
+def _write_atomic(path, data):
+    # 先写临时文件再替换，共享目录中的读者不会看到写了一半的文件
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class FolderWatcher:
+    """
+    Polls inputs for changed workbooks and regenerates their outputs on a
+    warm RenderScheduler.
+    """
+
+    def __init__(self, inputs, out_dir=None, titles=None, colors=None, output=None,
+                 settle=DEFAULT_SETTLE, history=False, workers=1):
+        from chart_generator import DEFAULT_TITLES
+        from scheduler import RenderScheduler
+
+        self.inputs = inputs
+        self.out_dir = out_dir
+        self.titles = titles or DEFAULT_TITLES
+        self.colors = colors
+        self.output = output or {}
+        self.settle = settle
+        self.history = history
+        self.files = {}
+        # 队列足够大：一次扫描发现的文件全部排队，不拒绝
+        self._scheduler = RenderScheduler(workers, queue_size=1 << 16)
+
+    def scan(self):
+        """
+        Returns the workbooks whose mtime/size changed and that have settled,
+        plus unchanged ones with missing outputs. Forgets files that
+        disappeared.
+        """
+        now = time.time()
+        paths = expand_inputs(self.inputs)
+        for path in set(self.files) - set(paths):
+            del self.files[path]
+
+        changed = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = self.files.get(path)
+            if entry is not None and entry.signature == (stat.st_mtime_ns, stat.st_size):
+                # 输出被删除时重新生成（解析与图表仍可命中缓存）
+                if entry.outputs and not all(os.path.exists(p) for p in entry.outputs):
+                    changed.append(path)
+                continue
+            if now - stat.st_mtime < self.settle:
+                # 仍在写入中，下次扫描再处理
+                continue
+            changed.append(path)
+        return changed
+
+    def refresh(self, path):
+        """
+        Brings the outputs of one workbook up to date. Returns a summary dict
+        with 'action' in ('unchanged', 'reused', 'rendered') or an error.
+        """
+        from data_processor import GROUP_COLUMN, calculate_stats
+        from pipeline import file_digest, load_frame, render_groups, render_panels, save_history
+        from utils import encode_image
+
+        start = time.perf_counter()
+        summary = {'input': path}
+        stat = os.stat(path)
+        entry = self.files.get(path) or WatchedFile(stat)
+        entry.signature = (stat.st_mtime_ns, stat.st_size)
+        self.files[path] = entry
+        outputs_exist = bool(entry.outputs) and all(os.path.exists(p) for p in entry.outputs)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = file_digest(data)
+            if digest == entry.digest and outputs_exist:
+                summary['action'] = 'unchanged'
+                return summary
+
+            _, df = load_frame(data)
+            entry.digest = digest
+            if self.history:
+                summary['history_days'] = save_history(df)
+            data_key = frame_digest(df)
+            if data_key == entry.data_key and outputs_exist:
+                summary['action'] = 'reused'
+                return summary
+
+            # 图表按解析后数据的哈希缓存，仅格式变化的文件直接命中
+            stem = output_stem(path, None, self.out_dir)
+            encoded = encode_image(render_panels(data_key, df, self.titles, self.colors), **self.output)
+            outputs = [f"{stem}_report.{encoded.extension}"]
+            _write_atomic(outputs[0], encoded.data)
+
+            stats = {key: _to_builtin(value) for key, value in calculate_stats(df).items()}
+            stats.update({'rows': len(df), 'coercions': df.attrs.get('coercions', {})})
+            if GROUP_COLUMN in df.columns:
+                groups = encode_image(render_groups(data_key, df, f"各{GROUP_COLUMN}日报推送", self.colors))
+                outputs.append(f"{stem}_groups.{groups.extension}")
+                _write_atomic(outputs[-1], groups.data)
+                stats['groups'] = int(df[GROUP_COLUMN].nunique())
+            outputs.append(f"{stem}_stats.json")
+            _write_atomic(outputs[-1], json.dumps(stats, ensure_ascii=False, indent=2).encode('utf-8'))
+
+            entry.data_key = data_key
+            entry.outputs = outputs
+            summary.update({'action': 'rendered', 'rows': len(df), 'image': outputs[0]})
+        except Exception as e:
+            # 签名已更新：出错的文件在再次变化前不会重复尝试
+            summary['error'] = str(e)
+        finally:
+            summary['seconds'] = time.perf_counter() - start
+        return summary
+
+    def poll(self):
+        """
+        Runs one scan and refreshes the changed workbooks. Returns their
+        summaries.
+        """
+        jobs = [self._scheduler.submit(('watch', path), self.refresh, path) for path in self.scan()]
+        return [job.result() for job in jobs]
+
+    def run(self, interval=DEFAULT_INTERVAL, once=False):
+        while True:
+            for summary in self.poll():
+                report(summary)
+            if once:
+                return
+            time.sleep(interval)
+
+    def shutdown(self):
+        self._scheduler.shutdown()
+
+
+def report(summary):
+    if 'error' in summary:
+        print(f"✗ {summary['input']}: {summary['error']}", file=sys.stderr)
+    elif summary['action'] == 'rendered':
+        print(f"✓ {summary['input']}: {summary['rows']} rows in {summary['seconds']:.2f}s "
+              f"-> {summary['image']}")
+    else:
+        print(f"· {summary['input']}: {summary['action']} ({summary['seconds'] * 1000:.0f} ms)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenerate chart reports when workbooks change")
+    parser.add_argument('inputs', nargs='+', help="folders, files or glob patterns to watch")
+    parser.add_argument('-o', '--out-dir', help="output directory (default: next to each input)")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help="seconds between scans")
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE,
+                        help="seconds a file must stay unchanged before it is processed")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="workbooks refreshed concurrently")
+    parser.add_argument('--titles', nargs=len(CHART_KINDS), metavar='TITLE',
+                        help=f"titles of the {len(CHART_KINDS)} charts, in {', '.join(CHART_KINDS)} order")
+    parser.add_argument('--format', choices=['png', 'png8', 'webp', 'jpeg'], default='png',
+                        help="composite image format (png8 = palette-quantized PNG)")
+    parser.add_argument('--quality', type=int, default=85, help="WebP/JPEG quality (1-100)")
+    parser.add_argument('--max-width', type=int, help="downscale composites wider than this")
+    parser.add_argument('--history', action='store_true',
+                        help="also upsert every changed workbook into the history store")
+    parser.add_argument('--once', action='store_true', help="scan once and exit")
+    args = parser.parse_args(argv)
+
+    from fonts import setup_fonts
+    import pipeline  # noqa: F401  预先导入绘图模块
+
+    # 字体与绘图模块在整个会话中只加载一次
+    setup_fonts()
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    output = {'fmt': args.format, 'quality': args.quality, 'max_width': args.max_width}
+    watcher = FolderWatcher(args.inputs, args.out_dir, args.titles, output=output,
+                            settle=0 if args.once else args.settle, history=args.history,
+                            workers=max(1, args.workers))
+    print(f"Watching {', '.join(args.inputs)} every {args.interval:g}s (Ctrl+C to stop)")
+    try:
+        watcher.run(args.interval, once=args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Browser-rendered (Vega-Lite) versions of the report charts.
+
+Charts come from the same registry as the matplotlib ones
+(chart_specs.CHART_SPECS): each style mirrors its chart_generator drawer
+(titles, color scheme, downsampling and bar binning) but only ships the
+series as inline JSON; the browser does the drawing, so viewing a report
+costs the server no rasterization. Specs are plain dicts for
+st.vega_lite_chart.
+"""
+
+import numpy as np
+
+from analytics import aggregate
+from chart_generator import (CHART_KINDS, CHART_SPECS, DEFAULT_COLORS, DOWNSAMPLE_POINTS, LARGE_SERIES_THRESHOLD,
+                             MARKER_THRESHOLD, TITLE_FONTSIZE, LABEL_FONTSIZE, TICK_FONTSIZE,
+                             LEGEND_FONTSIZE, lttb_indices, _bar_bins, _chart_frame,
+                             _has_date_index)
+from instrumentation import stage
+
+# 浏览器端图表高度（像素），宽度跟随容器
+CHART_HEIGHT = 360
+
+
+def _base_spec(title, values):
+    return {
+        '$schema': 'https://vega.github.io/schema/vega-lite/v5.json',
+        'title': {'text': title, 'fontSize': TITLE_FONTSIZE, 'fontWeight': 'bold'},
+        'height': CHART_HEIGHT,
+        'data': {'values': values},
+        'config': {
+            'axis': {'labelFontSize': TICK_FONTSIZE, 'titleFontSize': LABEL_FONTSIZE,
+                     'gridDash': [4, 4], 'gridOpacity': 0.5},
+            'legend': {'labelFontSize': LEGEND_FONTSIZE, 'orient': 'top', 'title': None},
+            'view': {'fill': '#F8F9FA'},
+        },
+    }
+
+
+def _color(series, colors):
+    # 系列名 -> 颜色，与 matplotlib 图表的配色一致
+    return {'field': 'series', 'type': 'nominal', 'sort': [column for column, _, _ in series],
+            'scale': {'domain': [column for column, _, _ in series],
+                      'range': [colors[key] for _, key, _ in series]}}
+
+
+def _line_spec(df, chart, title, colors):
+    df = _chart_frame(df)
+    use_dates = _has_date_index(df)
+    large = len(df) > LARGE_SERIES_THRESHOLD
+    frame = df.sort_index() if use_dates and large else df
+    x_numeric = frame.index.asi8 if use_dates else np.arange(len(frame))
+    x_values = frame.index.strftime('%Y-%m-%d') if use_dates else frame['日期'].to_numpy()
+
+    values = []
+    points = 0
+    for column in chart.columns:
+        y = frame[column].to_numpy()
+        # 与静态图表相同：长序列用 LTTB 降采样后再发送
+        keep = lttb_indices(x_numeric, y, DOWNSAMPLE_POINTS) if large else np.arange(len(y))
+        points = max(points, len(keep))
+        values.extend({'x': x, 'series': column, 'value': int(v)}
+                      for x, v in zip(x_values[keep], y[keep]))
+
+    x_encoding = {'field': 'x', 'title': '日期'}
+    if use_dates:
+        x_encoding.update(type='temporal', scale={'type': 'utc'},
+                          axis={'format': '%m-%d', 'formatType': 'utc', 'labelAngle': -45})
+    else:
+        x_encoding.update(type='ordinal', sort=None, axis={'labelAngle': -45})
+
+    spec = _base_spec(title, values)
+    spec['mark'] = {'type': 'line', 'point': points <= MARKER_THRESHOLD,
+                    'strokeWidth': 3 if not large else 2}
+    spec['encoding'] = {
+        'x': x_encoding,
+        'y': {'field': 'value', 'type': 'quantitative', 'title': '数量'},
+        'color': _color(chart.series, colors),
+        'tooltip': [{'field': 'x', 'title': '日期', 'type': x_encoding['type']},
+                    {'field': 'series', 'title': '指标'},
+                    {'field': 'value', 'title': '数量'}],
+    }
+    return spec
+
+
+def _bar_spec(df, chart, title, colors):
+    labels, binned, unit = _bar_bins(_chart_frame(df), chart.columns)
+
+    values = []
+    for column in chart.columns:
+        values.extend({'x': label, 'series': column, 'value': int(v)}
+                      for label, v in zip(labels, binned[column].to_numpy()))
+
+    spec = _base_spec(title, values)
+    spec['mark'] = {'type': 'bar', 'opacity': 0.85}
+    spec['encoding'] = {
+        'x': {'field': 'x', 'type': 'ordinal', 'sort': None, 'axis': {'labelAngle': -45},
+              'title': f'日期（按{unit}汇总）' if unit else '日期'},
+        'xOffset': {'field': 'series', 'sort': chart.columns},
+        'y': {'field': 'value', 'type': 'quantitative', 'title': '数量'},
+        'color': _color(chart.series, colors),
+        'tooltip': [{'field': 'x', 'title': '日期'}, {'field': 'series', 'title': '指标'},
+                    {'field': 'value', 'title': '数量'}],
+    }
+    return spec
+
+
+def _pie_spec(df, chart, title, colors):
+    totals = aggregate(df).totals
+    total = sum(totals[column] for column in chart.columns)
+    values = [{'series': column, 'value': totals[column],
+               'label': f"{totals[column] / total * 100:.1f}%\n({totals[column]})" if total else ''}
+              for column in chart.columns]
+
+    spec = _base_spec(title, values)
+    spec['encoding'] = {
+        'theta': {'field': 'value', 'type': 'quantitative', 'stack': True},
+        'color': _color(chart.series, colors),
+        'order': {'field': 'series', 'sort': 'ascending'},
+        'tooltip': [{'field': 'series', 'title': '指标'}, {'field': 'value', 'title': '数量'}],
+    }
+    spec['layer'] = [
+        {'mark': {'type': 'arc', 'outerRadius': 140, 'stroke': 'white', 'strokeWidth': 2}},
+        {'mark': {'type': 'text', 'radius': 85, 'fontSize': LABEL_FONTSIZE, 'fontWeight': 'bold',
+                  'fill': 'white', 'lineBreak': '\n'},
+         'encoding': {'text': {'field': 'label'}}},
+    ]
+    return spec
+
+
+# 图表样式 -> Vega-Lite 规格构建函数，与 chart_generator.CHART_DRAWERS 对应
+WEB_DRAWERS = {
+    'line': _line_spec,
+    'bar': _bar_spec,
+    'pie': _pie_spec,
+}
+
+
+def chart_spec(kind, df, title, colors=None):
+    """
+    Returns the Vega-Lite spec of one registered chart kind.
+    """
+    chart = CHART_SPECS[kind]
+    return WEB_DRAWERS[chart.style](df, chart, title, colors or DEFAULT_COLORS)
+
+
+def build_specs(df, titles, colors=None):
+    """
+    Returns the Vega-Lite specs of all charts in CHART_KINDS order.
+    """
+    if len(titles) != len(CHART_KINDS):
+        raise ValueError(f"需要 {len(CHART_KINDS)} 个标题，实际为 {len(titles)} 个")
+    with stage('web_specs', rows=len(df)) as event:
+        specs = [chart_spec(kind, df, title, colors) for kind, title in zip(CHART_KINDS, titles)]
+        event.info['points'] = sum(len(spec['data']['values']) for spec in specs)
+    return specs